@@ -1,11 +1,31 @@
 #! /usr/bin/env python3
 
 import sys
+import os
+import abc
 import itertools
-import functools
+import operator
 import re
 import subprocess
 import shlex
+import hashlib
+import tempfile
+import zlib
+import struct
+import mmap
+import atexit
+import queue
+import threading
+import time
+import json
+from collections import OrderedDict
+
+import myers
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 verbose = False
@@ -13,6 +33,173 @@ verbose = False
 # The git command (possibly including options) to use when computing diffs:
 git = ['git', '-c', 'diff.algorithm=myers']
 
+# The maximum total size, in bytes, of the compressed diffs kept in
+# the on-disk diff cache of each corpus directory. Set to 0 to disable
+# the on-disk cache:
+diff_cache_limit = 2 * 1024 * 1024 * 1024
+
+# The approximate amount of memory, in bytes, to use for keeping
+# recently-computed diffs in memory. The most recent diff is always
+# kept, even if it is bigger than this:
+diff_memory_limit = 256 * 1024 * 1024
+
+# The approximate maximum number of distinct SplitMeasurements
+# instances that `SplitMeasurements.measure_all()` shares between
+# calls, and of scores that each compiled scorer remembers (see
+# `BaseSplitScorer.compile()`). Each table is kept in two generations:
+# when the current one grows beyond this, it becomes the old one, and
+# entries that are still in use move back to the current one as they
+# are looked up:
+shared_measurements_limit = 100000
+
+# The maximum number of `git cat-file --batch` processes to keep per
+# repository. Diffs between blobs are computed in-process from blobs
+# read through these processes (see `myers`), rather than by running
+# `git diff`. Set to 0 to always run `git diff`:
+cat_file_pool_size = 2
+
+# If set, compute the diffs between two commits (given as full SHA-1s)
+# by feeding them to one long-running `git diff-tree --stdin` process
+# per repository, rather than running `git diff` for each of them
+# (see `DiffTree`):
+use_diff_tree = False
+
+# The Stats being collected, or None if statistics were not requested
+# (see `enable_stats()`). Instrumented code checks this before doing
+# anything else, so that collecting no statistics costs next to
+# nothing:
+stats = None
+
+
+class Stats:
+    """Timers and counters for the stages of the slider tools.
+
+    The time spent in each stage is accumulated, along with the
+    number of times that the stage was entered. Stages can overlap;
+    for example, `score` includes any `measure` that scoring
+    triggers. Counters record other events, such as cache hits.
+
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+
+        # Maps {stage : seconds} and {stage : calls}:
+        self.times = OrderedDict()
+        self.calls = OrderedDict()
+
+        # A map {name : count}:
+        self.counters = OrderedDict()
+
+    def add_time(self, stage, start, calls=1):
+        """Charge the time since start to stage.
+
+        start is a value returned by `time.perf_counter()`."""
+
+        elapsed = time.perf_counter() - start
+        self.times[stage] = self.times.get(stage, 0.0) + elapsed
+        self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """Add the times and counts recorded by other to this Stats."""
+
+        for (stage, seconds) in other.times.items():
+            self.times[stage] = self.times.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + other.calls[stage]
+        for (name, count) in other.counters.items():
+            self.count(name, count)
+
+    def as_dict(self):
+        return {
+            'wall_seconds': time.perf_counter() - self.start,
+            'stages': OrderedDict(
+                (stage, {'seconds': seconds, 'calls': self.calls[stage]})
+                for (stage, seconds) in self.times.items()
+                ),
+            'counters': self.counters,
+            }
+
+    def write(self, f):
+        """Write a human-readable breakdown to f."""
+
+        wall = time.perf_counter() - self.start
+        f.write('%-20s %10s %6s %12s\n' % ('stage', 'seconds', '%', 'calls'))
+        for (stage, seconds) in self.times.items():
+            f.write('%-20s %10.3f %6.1f %12d\n' % (
+                stage, seconds, 100.0 * seconds / max(wall, 1e-9),
+                self.calls[stage],
+                ))
+        f.write('%-20s %10.3f\n' % ('(wall time)', wall))
+        for (name, count) in self.counters.items():
+            f.write('%-20s %10d\n' % (name, count))
+
+    def report(self, json_filename=None):
+        """Report the statistics.
+
+        If json_filename is None, write a breakdown to stderr;
+        otherwise, write the statistics to json_filename as JSON."""
+
+        if json_filename is None:
+            self.write(sys.stderr)
+        else:
+            with open(json_filename, 'w') as f:
+                json.dump(self.as_dict(), f, indent=2)
+                f.write('\n')
+
+
+def add_stats_arguments(parser):
+    """Add the `--stats` and `--stats-json` options to an argparse parser."""
+
+    parser.add_argument(
+        '--stats', action='store_true',
+        help=(
+            'when done, write the time spent in each stage and other '
+            'statistics to stderr'
+            ),
+        )
+    parser.add_argument(
+        '--stats-json', metavar='FILE',
+        help='like --stats, but write the statistics to FILE as JSON',
+        )
+
+
+def enable_stats(json_filename=None):
+    """Start collecting statistics, and report them at exit.
+
+    See `Stats.report()` for the meaning of json_filename."""
+
+    global stats
+
+    stats = Stats()
+    atexit.register(stats.report, json_filename)
+
+
+def call_with_stats(function, *args, **kw):
+    """Call function in a worker process, and return (result, stats).
+
+    stats holds the statistics collected during the call, or is None if
+    none are being collected. Worker processes never report their
+    statistics themselves, so the parent process should pass them to
+    `merge_stats()`."""
+
+    global stats
+
+    if stats is None:
+        return (function(*args, **kw), None)
+
+    stats = Stats()
+    return (function(*args, **kw), stats)
+
+
+def merge_stats(worker_stats):
+    """Add statistics returned by `call_with_stats()` to our own."""
+
+    if stats is not None and worker_stats is not None:
+        stats.merge(worker_stats)
+
 
 class ParsingError(Exception):
     pass
@@ -36,6 +223,24 @@ def get_indent(line):
 
 
 class SplitMeasurements:
+    __slots__ = (
+        'end_of_hunk', 'indent', 'pre_blank', 'pre_indent',
+        'post_blank', 'post_indent',
+        )
+
+    # The version of the measurements. Increment it whenever the way
+    # that splits are measured changes, so that measurements stored in
+    # a FeatureStore are not used any more:
+    VERSION = 1
+
+    # Maps {key : SplitMeasurements} of the instances returned by
+    # `measure_all()`, which shares instances between all splits with
+    # the same measurements, so that scores can be cached per instance
+    # (see `BaseSplitScorer.compile()`). They are the current and the
+    # old generation (see `shared_measurements_limit`):
+    shared_instances = {}
+    old_shared_instances = {}
+
     def __init__(self):
         # Is the split at the end of the hunk (aside from any blank
         # lines)?
@@ -60,6 +265,34 @@ class SplitMeasurements:
         # line)?
         self.post_indent = None
 
+    def encode(self):
+        """Return these measurements as a tuple of integers.
+
+        None is represented as -1. See `decode()`."""
+
+        return (
+            int(self.end_of_hunk),
+            -1 if self.indent is None else self.indent,
+            self.pre_blank,
+            -1 if self.pre_indent is None else self.pre_indent,
+            self.post_blank,
+            -1 if self.post_indent is None else self.post_indent,
+            )
+
+    @staticmethod
+    def decode(values):
+        """Return the SplitMeasurements encoded by `encode()` as values."""
+
+        m = SplitMeasurements()
+        (
+            end_of_hunk, indent, m.pre_blank, pre_indent, m.post_blank, post_indent,
+            ) = values
+        m.end_of_hunk = bool(end_of_hunk)
+        m.indent = None if indent == -1 else indent
+        m.pre_indent = None if pre_indent == -1 else pre_indent
+        m.post_indent = None if post_indent == -1 else post_indent
+        return m
+
     @staticmethod
     def measure(lines, index):
         """Measure various characteristics of a split before lines[index].
@@ -93,8 +326,108 @@ class SplitMeasurements:
 
         return m
 
+    @staticmethod
+    def measure_all(lines):
+        """Measure every possible split of lines.
+
+        Return a list of `len(lines) + 1` SplitMeasurements instances,
+        where entry `index` is the same as `measure(lines, index)`
+        would return. Entries with equal measurements are the same
+        instance (usually even across calls), so they must not be
+        modified. This takes one pass over lines, whereas calling
+        `measure()` for every split can take time quadratic in the
+        length of runs of blank lines."""
+
+        if stats is not None:
+            start = time.perf_counter()
+
+        indents = [get_indent(line) for line in lines]
+
+        # For each index, the indent of the nearest non-blank line at
+        # or after index, and the number of blank lines before it:
+        next_indents = [None] * (len(lines) + 2)
+        next_blanks = [0] * (len(lines) + 2)
+        for i in range(len(lines) - 1, -1, -1):
+            if indents[i] is None:
+                next_indents[i] = next_indents[i + 1]
+                next_blanks[i] = next_blanks[i + 1] + 1
+            else:
+                next_indents[i] = indents[i]
+
+        # Splits with identical measurements share one instance:
+        instances = SplitMeasurements.shared_instances
+        if len(instances) > shared_measurements_limit:
+            SplitMeasurements.old_shared_instances = instances
+            SplitMeasurements.shared_instances = instances = {}
+        old_instances = SplitMeasurements.old_shared_instances
+
+        measurements = []
+        pre_indent = None
+        pre_blank = 0
+        for index in range(len(lines) + 1):
+            if index > 0:
+                if indents[index - 1] is None:
+                    pre_blank += 1
+                else:
+                    pre_indent = indents[index - 1]
+                    pre_blank = 0
+
+            key = (
+                index == len(lines),
+                indents[index] if index < len(lines) else None,
+                pre_blank, pre_indent,
+                next_blanks[index + 1], next_indents[index + 1],
+                )
+            m = instances.get(key)
+            if m is None:
+                m = old_instances.get(key)
+                if m is None:
+                    m = SplitMeasurements()
+                    (
+                        m.end_of_hunk, m.indent, m.pre_blank, m.pre_indent,
+                        m.post_blank, m.post_indent,
+                        ) = key
+                instances[key] = m
+
+            measurements.append(m)
+
+        if stats is not None:
+            stats.add_time('measure', start)
+        return measurements
+
+    @staticmethod
+    def forget_shared_instances():
+        """Stop sharing the instances returned so far by `measure_all()`."""
+
+        SplitMeasurements.shared_instances = {}
+        SplitMeasurements.old_shared_instances = {}
+
+
+# Compiled scorers (see `BaseSplitScorer.compile()`) pack the
+# effective indent and the penalty of a score into one integer,
+# `indent * SCORE_SCALE + penalty`, so that two scores can be added
+# with a single addition. This works as long as the penalties of the
+# scores being compared differ by less than `SCORE_SCALE // 2`, so the
+# penalty of a single split must be less than `PENALTY_LIMIT` in
+# magnitude. (The scale is kept small because Python's arithmetic is
+# fastest for integers of less than 30 bits.)
+SCORE_SCALE = 1 << 20
+PENALTY_LIMIT = SCORE_SCALE // 8
+
+
+class BaseSplitScorer(metaclass=abc.ABCMeta):
+    """The base class of the split scorers.
+
+    Subclasses describe how they score a split by implementing
+    `get_features()`. `evaluate()` is computed from it, so the scores
+    that are displayed always agree with the features that
+    optimize-weights uses. `compile()` uses
+    `make_scoring_function()`, which is also computed from it unless a
+    subclass provides a specialized version (`check-scoring` verifies
+    that they agree).
+
+    """
 
-class BaseSplitScorer:
     @classmethod
     def get_parameter_names(klass):
         return [name for (name, default) in klass.PARAMETERS]
@@ -132,6 +465,125 @@ class BaseSplitScorer:
 
         return self.evaluate(SplitMeasurements.measure(lines, index))
 
+    @classmethod
+    @abc.abstractmethod
+    def get_features(klass, m):
+        """Describe the score of a split as a linear function of the parameters.
+
+        Return a tuple `(indent, constant, coefficients)`, where
+        `coefficients` has one entry per parameter. For a scorer whose
+        parameter values are `p`, the split's score is equivalent to a
+        `SplitScore3` with effective indent `indent` and penalty
+        `constant + sum(c * v for (c, v) in zip(coefficients, p))`.
+        For scorers whose scores are plain numbers, `indent` is 0 and
+        the penalty is the score itself.
+
+        """
+
+    def make_score(self, indent, penalty):
+        """Return the score with the specified indent and penalty.
+
+        By default, scores are plain numbers, so indent (which is
+        always 0) is ignored."""
+
+        return penalty
+
+    def evaluate(self, m):
+        """Evaluate the score for a split with the specified measurements."""
+
+        (indent, constant, coefficients) = self.get_features(m)
+        parameters = [value for (name, value) in self.get_arguments()]
+        return self.make_score(
+            indent, constant + sum(map(operator.mul, coefficients, parameters)),
+            )
+
+    def make_scoring_function(self):
+        """Return a function that computes the score of a split.
+
+        The function takes a SplitMeasurements and returns its score,
+        with the indent and penalty described in `get_features()`,
+        packed into an integer (see `SCORE_SCALE`). If the penalty is
+        too large to be packed, it raises OverflowError. This version
+        evaluates `get_features()`; subclasses can override it with a
+        specialized function that gives the same results faster.
+
+        """
+
+        parameters = [value for (name, value) in self.get_arguments()]
+        get_features = self.get_features
+
+        def score(m):
+            (indent, constant, coefficients) = get_features(m)
+            penalty = constant + sum(map(operator.mul, coefficients, parameters))
+            if not -PENALTY_LIMIT < penalty < PENALTY_LIMIT:
+                raise OverflowError('penalty %d cannot be packed' % (penalty,))
+            return indent * SCORE_SCALE + penalty
+
+        return score
+
+    def compile(self):
+        """Return a fast function for scoring splits with this scorer.
+
+        The function is the one returned by `make_scoring_function()`,
+        except that the scores of recently-seen SplitMeasurements
+        instances are remembered (see `shared_measurements_limit`), so
+        it is fastest for the shared instances returned by
+        `SplitMeasurements.measure_all()`. It is created once per
+        scorer and then reused.
+
+        """
+
+        try:
+            return self._compiled
+        except AttributeError:
+            pass
+
+        score_split = self.make_scoring_function()
+
+        # Maps {SplitMeasurements : score}, the current and the old
+        # generation:
+        scores = {}
+        old_scores = {}
+
+        def score(m):
+            nonlocal scores, old_scores
+
+            try:
+                return scores[m]
+            except KeyError:
+                pass
+
+            ret = old_scores.get(m)
+            if ret is None:
+                ret = score_split(m)
+            if len(scores) >= shared_measurements_limit:
+                old_scores = scores
+                scores = {}
+            scores[m] = ret
+            return ret
+
+        self._compiled = score
+        return score
+
+    @classmethod
+    def get_parameter_matrix(klass, scorers):
+        """Return the parameter values of scorers, one row per scorer.
+
+        The result is a numpy array if numpy is available, otherwise a
+        list of tuples. It can be passed to
+        `SliderFeatures.find_best_shifts()`."""
+
+        rows = [
+            [value for (name, value) in scorer.get_arguments()]
+            for scorer in scorers
+            ]
+        if numpy is not None:
+            return numpy.array(rows, dtype=numpy.int64).reshape(
+                len(rows), len(klass.PARAMETERS),
+                )
+        else:
+            return [tuple(row) for row in rows]
+
     def iter_perturbed(self, steps, vary_parameters=None, max_perturbations=1,):
         yield self
 
@@ -214,26 +666,25 @@ class SplitScorer1(BaseSplitScorer):
         ('block_bonus', -1),
         ]
 
-    def evaluate(self, m):
-        """Evaluate the score for a split with the specified measurements."""
-
-        # A place to accumulate bonus factors (positive makes this
-        # index more favored):
-        bonus = 0
+    @classmethod
+    def get_features(klass, m):
+        # The bonuses that apply to this split (bonuses make this
+        # index more favored, so they are subtracted from the score):
+        bonuses = []
 
         if m.pre_indent is None and m.pre_blank == 0:
-            bonus += self.start_of_hunk_bonus
+            bonuses.append('start_of_hunk_bonus')
 
         if m.end_of_hunk:
-            bonus += self.end_of_hunk_bonus
+            bonuses.append('end_of_hunk_bonus')
 
         # Bonuses based on the location of blank lines:
         if m.pre_blank and m.indent is not None:
-            bonus += self.follows_blank_bonus
+            bonuses.append('follows_blank_bonus')
         elif m.indent is None and not m.pre_blank:
-            bonus += self.precedes_blank_bonus
+            bonuses.append('precedes_blank_bonus')
         elif m.indent is None and m.pre_blank:
-            bonus += self.between_blanks_bonus
+            bonuses.append('between_blanks_bonus')
 
         if m.indent is not None:
             indent = m.indent
@@ -249,7 +700,7 @@ class SplitScorer1(BaseSplitScorer):
             # is preferable to keep these lines together, so we
             # score it based on the larger indent:
             score = indent
-            bonus += self.relative_indent_bonus
+            bonuses.append('relative_indent_bonus')
 
         elif indent < m.pre_indent:
             # The line is indented less than its predecessor. It
@@ -261,14 +712,14 @@ class SplitScorer1(BaseSplitScorer):
                 # That was probably the end of a block. Score
                 # based on the line's own indent:
                 score = indent
-                bonus += self.relative_dedent_bonus
+                bonuses.append('relative_dedent_bonus')
             else:
                 # The following line is indented more. So it is
                 # likely that this line is the start of a block.
                 # It's a pretty good place to split, so score it
                 # based on its own indent:
                 score = indent
-                bonus += self.relative_outdent_bonus
+                bonuses.append('relative_outdent_bonus')
 
         else:
             # The line has the same indentation level as its
@@ -277,9 +728,12 @@ class SplitScorer1(BaseSplitScorer):
             # If it's not blank, that's a little bit of evidence
             # that the split is within a block of sibling lines:
             if m.indent is not None:
-                bonus += self.block_bonus
+                bonuses.append('block_bonus')
 
-        return 10 * score - bonus
+        coefficients = [
+            -bonuses.count(name) for name in klass.get_parameter_names()
+            ]
+        return (0, 10 * score, coefficients)
 
 
 class SplitScorer2(BaseSplitScorer):
@@ -299,28 +753,26 @@ class SplitScorer2(BaseSplitScorer):
         ('relative_dedent_has_blank_bonus', 50),
         ]
 
-    def evaluate(self, m):
-        """Evaluate the score for a split with the specified measurements."""
-
-        # A place to accumulate bonus factors (positive makes this
-        # index more favored):
-        bonus = 0
+    @classmethod
+    def get_features(klass, m):
+        # A map {parameter : weight} of the bonuses for this split
+        # (bonuses make this index more favored, so they are
+        # subtracted from the score):
+        bonuses = {}
 
         if m.pre_indent is None and m.pre_blank == 0:
-            bonus += self.start_of_hunk_bonus
+            bonuses['start_of_hunk_bonus'] = 1
 
         if m.end_of_hunk:
-            bonus += self.end_of_hunk_bonus
+            bonuses['end_of_hunk_bonus'] = 1
 
         total_blank = m.pre_blank
         if m.indent is None:
             total_blank += 1 + m.post_blank
 
         # Bonuses based on the location of blank lines:
-        bonus += (
-            self.total_blank_weight * total_blank
-            + self.pre_blank_weight * m.pre_blank
-            )
+        bonuses['total_blank_weight'] = total_blank
+        bonuses['pre_blank_weight'] = m.pre_blank
 
         if m.indent is not None:
             indent = m.indent
@@ -338,10 +790,8 @@ class SplitScorer2(BaseSplitScorer):
             # is preferable to keep these lines together, so we
             # score it based on the larger indent:
             score = indent
-            bonus += (
-                self.relative_indent_bonus
-                + self.relative_indent_has_blank_bonus * is_blank
-                )
+            bonuses['relative_indent_bonus'] = 1
+            bonuses['relative_indent_has_blank_bonus'] = is_blank
 
         elif indent < m.pre_indent:
             # The line is indented less than its predecessor. It
@@ -353,27 +803,26 @@ class SplitScorer2(BaseSplitScorer):
                 # That was probably the end of a block. Score
                 # based on the line's own indent:
                 score = indent
-                bonus += (
-                    self.relative_dedent_bonus
-                    + self.relative_dedent_has_blank_bonus * is_blank
-                    )
+                bonuses['relative_dedent_bonus'] = 1
+                bonuses['relative_dedent_has_blank_bonus'] = is_blank
             else:
                 # The following line is indented more. So it is
                 # likely that this line is the start of a block.
                 # It's a pretty good place to split, so score it
                 # based on its own indent:
                 score = indent
-                bonus += (
-                    self.relative_outdent_bonus
-                    + self.relative_outdent_has_blank_bonus * is_blank
-                    )
+                bonuses['relative_outdent_bonus'] = 1
+                bonuses['relative_outdent_has_blank_bonus'] = is_blank
 
         else:
             # The line has the same indentation level as its
             # predecessor. We score it based on its own indent:
             score = indent
 
-        return 10 * score - bonus
+        coefficients = [
+            -bonuses.get(name, 0) for name in klass.get_parameter_names()
+            ]
+        return (0, 10 * score, coefficients)
 
 
 class SplitScore3:
@@ -417,18 +866,20 @@ class SplitScorer3(BaseSplitScorer):
         ('relative_dedent_with_blank_penalty', 17),
         ]
 
-    def evaluate(self, m):
-        """Evaluate the score for a split with the specified measurements."""
+    def make_score(self, indent, penalty):
+        return SplitScore3(self, indent, penalty)
 
-        # A place to accumulate penalty factors (positive makes this
-        # index less favored):
-        penalty = 0
+    @classmethod
+    def get_features(klass, m):
+        # A map {parameter : weight} of the penalties for this split
+        # (penalties make this index less favored):
+        penalties = {}
 
         if m.pre_indent is None and m.pre_blank == 0:
-            penalty += self.start_of_hunk_penalty
+            penalties['start_of_hunk_penalty'] = 1
 
         if m.end_of_hunk:
-            penalty += self.end_of_hunk_penalty
+            penalties['end_of_hunk_penalty'] = 1
 
         # Set post_blank to the number of blank lines after the split,
         # including the line itself:
@@ -440,17 +891,15 @@ class SplitScorer3(BaseSplitScorer):
         total_blank = m.pre_blank + post_blank
 
         # Penalty based on the location of blank lines:
-        penalty += (
-            self.total_blank_weight * total_blank
-            + self.post_blank_weight * post_blank
-            )
+        penalties['total_blank_weight'] = total_blank
+        penalties['post_blank_weight'] = post_blank
 
         if m.indent is not None:
             indent = m.indent
         else:
             indent = m.post_indent
 
-        is_blank = int(bool(m.pre_blank + post_blank))
+        is_blank = bool(m.pre_blank + post_blank)
 
         if indent is None:
             effective_indent = -1
@@ -468,9 +917,9 @@ class SplitScorer3(BaseSplitScorer):
             # is preferable to keep these lines together, so we
             # score it based on the larger indent:
             if is_blank:
-                penalty += self.relative_indent_with_blank_penalty
+                penalties['relative_indent_with_blank_penalty'] = 1
             else:
-                penalty += self.relative_indent_penalty
+                penalties['relative_indent_penalty'] = 1
 
         elif indent == m.pre_indent:
             # No adjustments needed.
@@ -485,26 +934,382 @@ class SplitScorer3(BaseSplitScorer):
                 # That was probably the end of a block. Score
                 # based on the line's own indent:
                 if is_blank:
-                    penalty += self.relative_dedent_with_blank_penalty
+                    penalties['relative_dedent_with_blank_penalty'] = 1
                 else:
-                    penalty += self.relative_dedent_penalty
+                    penalties['relative_dedent_penalty'] = 1
             else:
                 # The following line is indented more. So it is
                 # likely that this line is the start of a block.
                 # It's a pretty good place to split, so score it
                 # based on its own indent:
                 if is_blank:
-                    penalty += self.relative_outdent_with_blank_penalty
+                    penalties['relative_outdent_with_blank_penalty'] = 1
+                else:
+                    penalties['relative_outdent_penalty'] = 1
+
+        coefficients = [
+            penalties.get(name, 0) for name in klass.get_parameter_names()
+            ]
+        return (effective_indent, 0, coefficients)
+
+    def make_scoring_function(self):
+        """Return a scoring function with the parameters bound as locals."""
+
+        start_of_hunk_penalty = self.start_of_hunk_penalty
+        end_of_hunk_penalty = self.end_of_hunk_penalty
+        total_blank_weight = self.total_blank_weight
+        post_blank_weight = self.post_blank_weight
+        relative_indent_penalty = self.relative_indent_penalty
+        relative_indent_with_blank_penalty = self.relative_indent_with_blank_penalty
+        relative_outdent_penalty = self.relative_outdent_penalty
+        relative_outdent_with_blank_penalty = self.relative_outdent_with_blank_penalty
+        relative_dedent_penalty = self.relative_dedent_penalty
+        relative_dedent_with_blank_penalty = self.relative_dedent_with_blank_penalty
+
+        def score(m):
+            pre_indent = m.pre_indent
+            pre_blank = m.pre_blank
+            indent = m.indent
+            if indent is None:
+                post_blank = 1 + m.post_blank
+                indent = m.post_indent
+            else:
+                post_blank = 0
+
+            total_blank = pre_blank + post_blank
+            penalty = (
+                total_blank_weight * total_blank
+                + post_blank_weight * post_blank
+                )
+
+            if pre_indent is None and pre_blank == 0:
+                penalty += start_of_hunk_penalty
+
+            if m.end_of_hunk:
+                penalty += end_of_hunk_penalty
+
+            if indent is None:
+                indent = -1
+            elif pre_indent is None or indent == pre_indent:
+                # No adjustments needed.
+                pass
+            elif indent > pre_indent:
+                if total_blank:
+                    penalty += relative_indent_with_blank_penalty
+                else:
+                    penalty += relative_indent_penalty
+            elif m.post_indent is None or indent >= m.post_indent:
+                # A dedent:
+                if total_blank:
+                    penalty += relative_dedent_with_blank_penalty
+                else:
+                    penalty += relative_dedent_penalty
+            else:
+                # An outdent:
+                if total_blank:
+                    penalty += relative_outdent_with_blank_penalty
                 else:
-                    penalty += self.relative_outdent_penalty
+                    penalty += relative_outdent_penalty
 
-        return SplitScore3(self, effective_indent, penalty)
+            if not -PENALTY_LIMIT < penalty < PENALTY_LIMIT:
+                raise OverflowError('penalty %d cannot be packed' % (penalty,))
+            return indent * SCORE_SCALE + penalty
+
+        return score
 
 
 DefaultSplitScorer = SplitScorer3
 
 
+class SliderFeatures:
+    """The scores of all of a slider's shifts, as functions of the parameters.
+
+    This allows the best shifts according to many scorers (of one
+    class) to be computed at once. See
+    `BaseSplitScorer.get_features()` for the meaning of the indents,
+    constants and coefficients; here they describe the sum of the
+    scores of the two splits implied by each shift.
+
+    """
+
+    def __init__(self, shifts, indents, constants, coefficients):
+        # The possible shifts, in increasing order:
+        self.shifts = shifts
+
+        # For each shift, its total effective indent:
+        self.indents = indents
+
+        # For each shift, the constant part of its penalty:
+        self.constants = constants
+
+        # For each shift, a list of the coefficients of the parameters
+        # in its penalty:
+        self.coefficients = coefficients
+
+        if numpy is not None:
+            self.indent_array = numpy.array(indents, dtype=numpy.int64)
+            self.constant_array = numpy.array(constants, dtype=numpy.int64)
+            self.coefficient_array = numpy.array(
+                coefficients, dtype=numpy.int64,
+                ).reshape(len(shifts), -1)
+
+    @staticmethod
+    def from_measurements(scorer_class, shifts, pre_measurements, post_measurements):
+        """Return the SliderFeatures of a slider for scorer_class.
+
+        pre_measurements and post_measurements are the measurements
+        of the splits before and after the change for each of the
+        shifts, as returned by `Slider.get_split_measurements()`."""
+
+        indents = []
+        constants = []
+        coefficients = []
+        for (m1, m2) in zip(pre_measurements, post_measurements):
+            (indent1, constant1, coefficients1) = scorer_class.get_features(m1)
+            (indent2, constant2, coefficients2) = scorer_class.get_features(m2)
+            indents.append(indent1 + indent2)
+            constants.append(constant1 + constant2)
+            coefficients.append([
+                c1 + c2 for (c1, c2) in zip(coefficients1, coefficients2)
+                ])
+
+        return SliderFeatures(shifts, indents, constants, coefficients)
+
+    def get_signature(self):
+        """Return a hashable value that determines this slider's decisions.
+
+        Two sliders with the same signature get the same best shift
+        from every scorer, so they only need to be evaluated once."""
+
+        return (
+            tuple(self.shifts), tuple(self.indents), tuple(self.constants),
+            tuple(tuple(row) for row in self.coefficients),
+            )
+
+    def find_best_shifts(self, parameters):
+        """Return the best shift according to each of many scorers.
+
+        `parameters` is a matrix with one row of parameter values per
+        scorer, as returned by `get_parameter_matrix()`. Return a list
+        of the best shift for each scorer. The result is the same as
+        `Slider.find_best_shift()` would give, including which shift
+        wins ties.
+
+        """
+
+        if stats is None:
+            return self._find_best_shifts(parameters)
+
+        start = time.perf_counter()
+        shifts = self._find_best_shifts(parameters)
+        stats.add_time('evaluate', start)
+        stats.count('scorer evaluations', len(parameters))
+        return shifts
+
+    def _find_best_shifts(self, parameters):
+        if len(self.shifts) == 1:
+            return [self.shifts[0]] * len(parameters)
+
+        if numpy is None:
+            return [
+                self.shifts[self._find_best_index(row)]
+                for row in parameters
+                ]
+
+        # An array of the penalties, indexed by [shift, scorer]:
+        penalties = (
+            self.constant_array[:, numpy.newaxis]
+            + self.coefficient_array @ numpy.asarray(parameters).T
+            )
+
+        best = numpy.zeros(len(parameters), dtype=numpy.intp)
+        best_indent = numpy.full(len(parameters), self.indents[0], dtype=numpy.int64)
+        best_penalty = penalties[0].copy()
+
+        for i in range(1, len(self.shifts)):
+            indent = self.indents[i]
+            cmp_indents = (
+                (indent > best_indent).astype(numpy.int64)
+                - (indent < best_indent)
+                )
+            better = 60 * cmp_indents + (penalties[i] - best_penalty) <= 0
+            best[better] = i
+            best_indent[better] = indent
+            best_penalty[better] = penalties[i][better]
+
+        return numpy.array(self.shifts)[best].tolist()
+
+    def get_radii(self, parameters):
+        """Return the best shift for one scorer and how robust it is.
+
+        Return `(shift, radii)`, where shift is the best shift
+        according to the scorer with the specified parameter values
+        and radii contains one entry per parameter. Each radius is a
+        number R such that changing only that parameter by at most R
+        cannot change the outcome of any of the comparisons that
+        `find_best_shifts()` makes, and therefore cannot change the
+        best shift. If several parameters change at once, by deltas
+        d_k, the best shift is unchanged if `sum(|d_k| / R_k) <= 1`. A
+        radius of None means that the parameter has no effect on the
+        comparisons.
+
+        """
+
+        best_shift = self.shifts[self._find_best_index(parameters)]
+
+        if len(self.shifts) == 1:
+            return (best_shift, [None] * len(parameters))
+
+        if numpy is None:
+            return (best_shift, self._get_radii(parameters))
+
+        parameters = numpy.asarray(parameters, dtype=numpy.int64)
+        penalties = self.constant_array + self.coefficient_array @ parameters
+
+        # The comparisons made by `find_best_shifts()` are always
+        # between a shift j and some earlier shift i:
+        (i, j) = numpy.triu_indices(len(self.shifts), 1)
+        indents = self.indent_array
+        cmp_indents = (
+            (indents[j] > indents[i]).astype(numpy.int64)
+            - (indents[j] < indents[i])
+            )
+        values = 60 * cmp_indents + (penalties[j] - penalties[i])
+
+        # How far each value can move before the comparison flips:
+        slack = numpy.where(values <= 0, -values, values - 1)
+        deltas = numpy.abs(
+            self.coefficient_array[j] - self.coefficient_array[i]
+            )
+        limit = numpy.iinfo(numpy.int64).max
+        radii = numpy.where(
+            deltas > 0,
+            slack[:, numpy.newaxis] // numpy.maximum(deltas, 1),
+            limit,
+            ).min(axis=0)
+
+        return (
+            best_shift,
+            [None if r == limit else r for r in radii.tolist()],
+            )
+
+    def _get_radii(self, parameters):
+        penalties = [
+            constant + sum(c * v for (c, v) in zip(coefficients, parameters))
+            for (constant, coefficients)
+            in zip(self.constants, self.coefficients)
+            ]
+        radii = [None] * len(parameters)
+        for j in range(1, len(self.shifts)):
+            for i in range(j):
+                cmp_indents = (
+                    (self.indents[j] > self.indents[i])
+                    - (self.indents[j] < self.indents[i])
+                    )
+                value = 60 * cmp_indents + (penalties[j] - penalties[i])
+                slack = -value if value <= 0 else value - 1
+                for k in range(len(parameters)):
+                    delta = abs(
+                        self.coefficients[j][k] - self.coefficients[i][k]
+                        )
+                    if delta:
+                        radius = slack // delta
+                        if radii[k] is None or radius < radii[k]:
+                            radii[k] = radius
+
+        return radii
+
+    def _find_best_index(self, parameters):
+        best_index = None
+        for (i, coefficients) in enumerate(self.coefficients):
+            indent = self.indents[i]
+            penalty = self.constants[i] + sum(
+                c * v for (c, v) in zip(coefficients, parameters)
+                )
+            if best_index is None:
+                better = True
+            else:
+                cmp_indents = (indent > best_indent) - (indent < best_indent)
+                better = 60 * cmp_indents + (penalty - best_penalty) <= 0
+            if better:
+                best_index = i
+                best_indent = indent
+                best_penalty = penalty
+
+        return best_index
+
+    def get_outcomes(self, parameters, k):
+        """Return how the best shift depends on the value of parameter k.
+
+        The other parameters are held at the values in parameters.
+        Return `(breakpoints, shifts)`, where breakpoints is a sorted
+        list of integers `t_1 < ... < t_m` and shifts is a list of
+        `m + 1` shifts: if parameter k has the value x, the best shift
+        is `shifts[r]`, where r is the number of breakpoints that are
+        less than x. The outcome of each comparison that
+        `find_best_shifts()` makes is linear in x, so it can only
+        change where that linear function crosses zero.
+
+        """
+
+        n = len(self.shifts)
+        if n == 1:
+            return ([], [self.shifts[0]])
+
+        # The penalty of shift i is base[i] + slopes[i] * x:
+        slopes = [coefficients[k] for coefficients in self.coefficients]
+        base = [
+            constant
+            + sum(c * v for (c, v) in zip(coefficients, parameters))
+            - coefficients[k] * parameters[k]
+            for (constant, coefficients) in zip(self.constants, self.coefficients)
+            ]
+
+        breakpoints = set()
+        for j in range(1, n):
+            for i in range(j):
+                b = slopes[j] - slopes[i]
+                if b == 0:
+                    continue
+                cmp_indents = (
+                    (self.indents[j] > self.indents[i])
+                    - (self.indents[j] < self.indents[i])
+                    )
+                a = 60 * cmp_indents + (base[j] - base[i])
+                # Shift j is preferred over shift i iff a + b * x <= 0:
+                if b > 0:
+                    # ...that is, iff x <= floor(-a / b):
+                    breakpoints.add((-a) // b)
+                else:
+                    # ...that is, iff x >= ceil(-a / b):
+                    breakpoints.add(-((-a) // (-b)) - 1)
+        breakpoints = sorted(breakpoints)
+
+        def find_best_shift(x):
+            best_index = 0
+            best_indent = self.indents[0]
+            best_penalty = base[0] + slopes[0] * x
+            for i in range(1, n):
+                indent = self.indents[i]
+                penalty = base[i] + slopes[i] * x
+                cmp_indents = (indent > best_indent) - (indent < best_indent)
+                if 60 * cmp_indents + (penalty - best_penalty) <= 0:
+                    best_index = i
+                    best_indent = indent
+                    best_penalty = penalty
+            return self.shifts[best_index]
+
+        if not breakpoints:
+            return ([], [find_best_shift(parameters[k])])
+
+        shifts = [find_best_shift(breakpoints[0])]
+        shifts.extend(find_best_shift(t + 1) for t in breakpoints)
+        return (breakpoints, shifts)
+
+
 class DiffLine:
+    __slots__ = ('prefix', 'line')
+
     def __init__(self, prefix, line):
         self.prefix = prefix
         self.line = line
@@ -517,6 +1322,8 @@ class DiffLine:
 
 
 class Group:
+    __slots__ = ('difflines',)
+
     def __init__(self, difflines):
         self.difflines = list(difflines)
 
@@ -534,11 +1341,15 @@ class Group:
 
 
 class Context(Group):
+    __slots__ = ()
+
     def __getitem__(self, i):
         return self.difflines[i]
 
 
 class Change(Group):
+    __slots__ = ('deletes', 'adds', 'prefix')
+
     def __init__(self, difflines):
         if not difflines:
             raise ParsingError('difflines is empty')
@@ -582,28 +1393,79 @@ class Change(Group):
 
 
 class Slider:
+    """A group of added or deleted lines that can be slid up or down.
+
+    The slider's lines are kept in one list, `lines`, that doesn't
+    change when the slider is slid; the change is `lines[start:end]`.
+    `pre_context`, `change`, and `post_context` are built from these
+    when they are accessed. The sliders of a hunk that are on the same
+    side of the diff can share `lines` and `prefixes`, so they must not
+    be modified.
+
+    """
+
+    __slots__ = (
+        'lines', 'prefixes', 'start', 'end', 'moved_start', 'moved_end',
+        'line_number', 'prefix', 'shift_range', 'measurements',
+        )
+
     def __init__(self, pre_context, change, post_context, line_number):
         # Replacements cannot be slid:
         assert change.prefix in '+-'
 
-        self.pre_context = pre_context
-        self.change = change
-        self.post_context = post_context
-        self.difflines = list(itertools.chain(pre_context, change, post_context))
+        difflines = list(itertools.chain(pre_context, change, post_context))
+
+        self._initialize(
+            [diffline.line for diffline in difflines],
+            ''.join(diffline.prefix for diffline in difflines),
+            len(pre_context), len(pre_context) + len(change),
+            line_number, change.prefix,
+            )
+
+    @classmethod
+    def from_lines(klass, lines, prefixes, start, end, line_number, prefix):
+        """Create a Slider whose change is lines[start:end].
+
+        prefixes is a string holding the original prefix of each of
+        lines, and prefix is the prefix of the change ('-' or '+').
+        lines and prefixes are not copied, so they can be shared by
+        all of the sliders on one side of a hunk."""
+
+        assert prefix in '+-'
+
+        self = klass.__new__(klass)
+        self._initialize(lines, prefixes, start, end, line_number, prefix)
+        return self
+
+    def _initialize(self, lines, prefixes, start, end, line_number, prefix):
+        # The text of all of the lines, and the prefixes that they had
+        # originally:
+        self.lines = lines
+        self.prefixes = prefixes
+
+        # The change consists of self.lines[self.start:self.end]:
+        self.start = start
+        self.end = end
+
+        # The lines that have been part of the change at any shift.
+        # When they are not part of the change, they are shown as
+        # context lines:
+        self.moved_start = self.start
+        self.moved_end = self.end
 
         # The line number of the first line of the change:
         self.line_number = line_number
 
-        self.prefix = self.change.prefix
+        self.prefix = prefix
 
         self.shift_range = self._compute_shift_range()
         # Ensure we have no non-slidable sliders:
         assert len(self.shift_range) > 1
 
-        self.lines = [diffline.line for diffline in self.difflines]
-
-        # A cache of measure() results:
-        self.measurements = dict()
+        # The SplitMeasurements for every split of self.lines, computed
+        # when first needed. Sliding doesn't change self.lines, so
+        # these remain valid across shifts:
+        self.measurements = None
 
         if verbose:
             sys.stderr.write(
@@ -611,13 +1473,52 @@ class Slider:
                 % (self.shift_range[0], self.shift_range[-1], self.line_number)
                 )
 
+    def _get_difflines(self, start, end):
+        """Return DiffLines for lines[start:end], as currently shifted."""
+
+        difflines = []
+        for i in range(start, end):
+            if self.start <= i < self.end:
+                prefix = self.prefix
+            elif self.moved_start <= i < self.moved_end:
+                prefix = ' '
+            else:
+                prefix = self.prefixes[i]
+            difflines.append(DiffLine(prefix, self.lines[i]))
+
+        return difflines
+
+    @property
+    def pre_context(self):
+        return Context(self._get_difflines(0, self.start))
+
+    @property
+    def change(self):
+        return Change(self._get_difflines(self.start, self.end))
+
+    @property
+    def post_context(self):
+        return Context(self._get_difflines(self.end, len(self.lines)))
+
+    @property
+    def difflines(self):
+        """All of the lines, with the prefixes that they had originally."""
+
+        return [
+            DiffLine(prefix, line)
+            for (prefix, line) in zip(self.prefixes, self.lines)
+            ]
+
     def __getitem__(self, i):
-        """Return the line, counted from the first line of change."""
+        """Return the line, counted from the first line of change.
 
-        if i < -len(self.pre_context):
+        The line has the prefix that it had originally."""
+
+        if i < -self.start:
             raise KeyError(i)
 
-        return self.difflines[i + len(self.pre_context)]
+        i += self.start
+        return DiffLine(self.prefixes[i], self.lines[i])
 
     def shift_canonically(self):
         """Shift this slider as far down as possible.
@@ -637,12 +1538,10 @@ class Slider:
     def measure(self, split):
         """Return a SplitMeasurements for the specified split."""
 
-        m = self.measurements.get(split)
-        if m is None:
-            m = SplitMeasurements.measure(self.lines, split + len(self.pre_context))
-            self.measurements[split] = m
+        if self.measurements is None:
+            self.measurements = SplitMeasurements.measure_all(self.lines)
 
-        return m
+        return self.measurements[split + self.start]
 
     def get_score_for_split(self, scorer, split):
         """Return the score for splitting above the specified line.
@@ -653,10 +1552,10 @@ class Slider:
 
     def get_score(self, scorer, shift):
         split1 = shift
-        split2 = shift + len(self.change)
+        split2 = shift + self.end - self.start
 
-        assert -len(self.pre_context) <= split1
-        assert split2 <= len(self.change) + len(self.post_context)
+        assert -self.start <= split1
+        assert split2 <= len(self.lines) - self.start
         return (
             self.get_score_for_split(scorer, split1)
             + self.get_score_for_split(scorer, split2)
@@ -667,18 +1566,18 @@ class Slider:
 
         shift_min = 0
         while (
-                len(self.pre_context) + shift_min - 1 >= 0
-                and len(self.change) + shift_min - 1 >= 0
+                self.start + shift_min - 1 >= 0
+                and self.end - self.start + shift_min - 1 >= 0
                 and (self[shift_min - 1].line
-                     == self[len(self.change) + shift_min - 1].line)
+                     == self[self.end - self.start + shift_min - 1].line)
                 ):
             shift_min -= 1
 
         shift_limit = 1
-        while (shift_limit <= len(self.change)
-               and shift_limit <= len(self.post_context)
+        while (shift_limit <= self.end - self.start
+               and shift_limit <= len(self.lines) - self.end
                and (self[shift_limit - 1].line
-                    == self[len(self.change) + shift_limit - 1].line)
+                    == self[self.end - self.start + shift_limit - 1].line)
                 ):
             shift_limit += 1
 
@@ -688,80 +1587,110 @@ class Slider:
         if shift == 0:
             return
 
-        if shift < 0:
-            if verbose:
+        if verbose:
+            if shift < 0:
                 sys.stderr.write(
                     'Sliding hunk up by %d from %d to %d\n' % (
                         -shift, self.line_number, self.line_number + shift,
                         )
                     )
-
-            # Move lines from end of change to post-context:
-            difflines = [
-                DiffLine(' ', diffline.line)
-                for diffline in self.change.difflines[shift:]
-                ]
-            del self.change.difflines[shift:]
-            self.post_context.difflines[0:0] = difflines
-
-            # Move lines from end of pre-context to change:
-            difflines = [
-                DiffLine(self.change.prefix, diffline.line)
-                for diffline in self.pre_context[shift:]
-                ]
-            del self.pre_context.difflines[shift:]
-            self.change.difflines[0:0] = difflines
-            if self.change.prefix == '-':
-                self.change.deletes.difflines[0:0] = difflines
             else:
-                self.change.adds.difflines[0:0] = difflines
-        elif shift > 0:
-            if verbose:
                 sys.stderr.write(
                     'Sliding hunk down by %d from %d to %d\n' % (
                         shift, self.line_number, self.line_number + shift,
                         )
                     )
 
-            # Move lines from beginning of change to pre-context:
-            difflines = [
-                DiffLine(' ', diffline.line)
-                for diffline in self.change.difflines[:shift]
-                ]
-            del self.change.difflines[:shift]
-            self.pre_context.difflines.extend(difflines)
-
-            # Move lines from begining of post-context to change:
-            difflines = [
-                DiffLine(self.change.prefix, diffline.line)
-                for diffline in self.post_context[:shift]
-                ]
-            del self.post_context.difflines[:shift]
-            self.change.difflines.extend(difflines)
-            if self.change.prefix == '-':
-                self.change.deletes.difflines.extend(difflines)
-            else:
-                self.change.adds.difflines.extend(difflines)
+        self.start += shift
+        self.end += shift
+        self.moved_start = min(self.moved_start, self.start)
+        self.moved_end = max(self.moved_end, self.end)
 
         self.shift_range = range(self.shift_range.start - shift,
                                  self.shift_range.stop - shift)
         self.line_number += shift
 
-        self.measurements = dict()
+    def get_split_measurements(self):
+        """Return the measurements of the splits for all of the shifts.
+
+        Return (shifts, pre_measurements, post_measurements), where
+        shifts is a list of the possible shifts, and the other two are
+        lists of the SplitMeasurements of the splits before and after
+        the change when the slider is shifted by each of them."""
+
+        shifts = list(self.shift_range)
+        return (
+            shifts,
+            [self.measure(shift) for shift in shifts],
+            [self.measure(shift + self.end - self.start) for shift in shifts],
+            )
+
+    def get_features(self, scorer_class):
+        """Return a SliderFeatures describing this slider's shifts."""
+
+        return SliderFeatures.from_measurements(
+            scorer_class, *self.get_split_measurements()
+            )
 
     def find_best_shift(self, scorer):
         if len(self.shift_range) == 1:
             return self.shift_range[0]
 
+        if stats is not None:
+            start = time.perf_counter()
+
+        # Compare the packed scores of the shifts (see `SCORE_SCALE`)
+        # in the same way as `SplitScore3.__le__()`. That relation is
+        # not transitive, so it can't be replaced by comparing a
+        # single key. But if the difference between two scores is
+        # less than half of SCORE_SCALE in magnitude, their indents
+        # are equal, and the difference is the difference of their
+        # penalties. Otherwise, the difference of their penalties is
+        # the difference modulo SCORE_SCALE. For scorers whose scores
+        # are plain numbers, the indents are all 0, so this is the
+        # same as comparing the numbers:
+        score = scorer.compile()
+        if self.measurements is None:
+            self.measurements = SplitMeasurements.measure_all(self.lines)
+        measurements = self.measurements
+        split1 = self.start
+        split2 = self.end
+        half = SCORE_SCALE // 2
+        neg_half = -half
+
         best_shift = 0
-        best_score = None
+        best = None
 
-        for shift in self.shift_range:
-            score = self.get_score(scorer, shift)
-            if best_score is None or score <= best_score:
+        try:
+            for shift in self.shift_range:
+                total = score(measurements[split1 + shift]) + score(measurements[split2 + shift])
+                if best is not None:
+                    difference = total - best
+                    if difference >= half:
+                        # A larger indent:
+                        if (difference + half) % SCORE_SCALE - half > -60:
+                            continue
+                    elif difference < neg_half:
+                        # A smaller indent:
+                        if (difference + half) % SCORE_SCALE - half > 60:
+                            continue
+                    elif difference > 0:
+                        continue
                 best_shift = shift
-                best_score = score
-
+                best = total
+        except OverflowError:
+            # Some penalty is too large to be packed, so compare the
+            # scores the slow way:
+            best_shift = 0
+            best_score = None
+            for shift in self.shift_range:
+                score = self.get_score(scorer, shift)
+                if best_score is None or score <= best_score:
+                    best_shift = shift
+                    best_score = score
+
+        if stats is not None:
+            stats.add_time('score', start)
         return best_shift
 
     def prefix_for(self, shift, i, c='|'):
@@ -769,21 +1698,21 @@ class Slider:
 
         Otherwise, return SP."""
 
-        if shift <= i < shift + len(self.change):
+        if shift <= i < shift + self.end - self.start:
             return c
         else:
             return ' '
 
     def enumerate(self):
-        return enumerate(self.difflines, start=-len(self.pre_context))
+        return enumerate(self.difflines, start=-self.start)
 
-    def show(self, scorer, slider_context=5):
+    def show(self, scorer, slider_context=5, file=None):
         best_shift = self.find_best_shift(scorer)
 
-        print('v' * 60)
+        print('v' * 60, file=file)
 
         show_range = range(self.shift_range.start - slider_context,
-                           self.shift_range.stop + len(self.change) + slider_context)
+                           self.shift_range.stop + self.end - self.start + slider_context)
 
         for (i, diffline) in self.enumerate():
             if i not in show_range:
@@ -791,7 +1720,7 @@ class Slider:
 
             if i in self.shift_range:
                 score = str(self.get_score_for_split(scorer, i))
-            elif i - len(self.change) in self.shift_range:
+            elif i - (self.end - self.start) in self.shift_range:
                 score = str(self.get_score_for_split(scorer, i))
             else:
                 score = ''
@@ -800,26 +1729,27 @@ class Slider:
                 self.prefix_for(self.shift_range[0], i),
                 self.prefix_for(self.shift_range[-1], i),
                 score,
-                self.prefix_for(best_shift, i, self.change.prefix),
-                diffline))
+                self.prefix_for(best_shift, i, self.prefix),
+                diffline), file=file)
 
-        i = self.shift_range[-1] + len(self.change)
+        i = self.shift_range[-1] + self.end - self.start
         if (
-                i == len(self.change) + len(self.post_context)
-                and i - len(self.change) in self.shift_range
+                i == len(self.lines) - self.start
+                and i - (self.end - self.start) in self.shift_range
                 ):
             score = str(self.get_score_for_split(scorer, i))
             print('         %s%s %8s %s >%s' % (
                 ' ', ' ',
                 score,
                 ' ',
-                '<EOF>'))
+                '<EOF>'), file=file)
 
-        print('^' * 60)
+        print('^' * 60, file=file)
 
-    def show_comparison(self, columns, line_prefix='', slider_context=5):
+    def show_comparison(self, columns, line_prefix='', slider_context=5,
+                        file=None):
         show_range = range(self.shift_range.start - slider_context,
-                           len(self.change) + self.shift_range.stop + slider_context)
+                           self.end - self.start + self.shift_range.stop + slider_context)
 
         for (i, diffline) in self.enumerate():
             if not i in show_range:
@@ -845,7 +1775,7 @@ class Slider:
                 line_prefix,
                 16 - len(line_prefix), annotation,
                 diffline.line
-                ))
+                ), file=file)
 
 
 class Hunk:
@@ -916,14 +1846,67 @@ class Hunk:
         self.difflines = [DiffLine(line[0], line[1:]) for line in lines[1:]]
         self.groups = list(self.iter_groups(self.difflines))
 
+    @classmethod
+    def from_difflines(
+            klass, old_filename, new_filename,
+            old_line, old_len, new_line, new_len, difflines,
+            ):
+        """Create a Hunk from the values in its header and its DiffLines.
+
+        The values have the same meaning as the corresponding
+        attributes of Hunks that are parsed from text; in particular,
+        old_len or new_len is None if it would be omitted from the
+        header."""
+
+        self = klass.__new__(klass)
+        self.old_filename = old_filename
+        self.new_filename = new_filename
+        self.old_line = old_line
+        self.old_len = old_len
+        self.new_line = new_line
+        self.new_len = new_len
+        self.difflines = difflines
+        self.groups = list(self.iter_groups(self.difflines))
+        return self
+
+    def _get_side(self, prefix):
+        """Return the lines on one side of this hunk.
+
+        Return (lines, prefixes, offsets), where lines is a list of the
+        text of the lines on the old side of the hunk (if prefix is
+        '-') or the new side (if prefix is '+'), prefixes is a string
+        holding their prefixes, and offsets[i] is the index in lines of
+        the first line of self.groups[i]."""
+
+        lines = []
+        prefixes = []
+        offsets = []
+        for group in self.groups:
+            offsets.append(len(lines))
+            if prefix == '-':
+                difflines = group.old_lines()
+            else:
+                difflines = group.new_lines()
+            lines.extend(diffline.line for diffline in difflines)
+            prefixes.extend(diffline.prefix for diffline in difflines)
+
+        return (lines, ''.join(prefixes), offsets)
+
     def iter_sliders(self):
+        # All of the sliders on one side of the hunk use all of the
+        # lines on that side as context, so they share the arrays
+        # returned by _get_side(), which are computed when first
+        # needed:
+        sides = dict()
+
         for i in range(1, len(self.groups) - 1, 2):
+            if stats is not None:
+                start = time.perf_counter()
+
             pre_group, change, post_group = self.groups[i - 1:i + 2]
             if change.prefix == '-':
-                selector = lambda group: group.old_lines()
                 reference_line = self.old_line
             elif change.prefix == '+':
-                selector = lambda group: group.new_lines()
                 reference_line = self.new_line
             else:
                 # Mixed deletion/additions cannot be sliders:
@@ -939,25 +1922,21 @@ class Hunk:
                 # This change cannot be slid:
                 continue
 
+            side = sides.get(change.prefix)
+            if side is None:
+                side = sides[change.prefix] = self._get_side(change.prefix)
+            (lines, prefixes, offsets) = side
+
             # Use all of the lines in the hunk as context:
-            pre_lines = functools.reduce(
-                list.__iadd__,
-                [selector(group) for group in self.groups[:i]],
-                []
-                )
-            post_lines = functools.reduce(
-                list.__iadd__,
-                [selector(group) for group in self.groups[i + 1:]],
-                []
-                )
-            line_number = reference_line + len(pre_lines)
-
-            yield Slider(
-                Context(pre_lines),
-                Change(change.difflines),
-                Context(post_lines),
-                line_number,
+            slider = Slider.from_lines(
+                lines, prefixes,
+                offsets[i], offsets[i] + len(change),
+                reference_line + offsets[i],
+                change.prefix,
                 )
+            if stats is not None:
+                stats.add_time('sliders', start)
+            yield slider
 
     def old_lines(self):
         for group in self.groups:
@@ -1009,6 +1988,11 @@ class FileDiff:
 
         self.hunks = []
 
+        # These remain None if the diff has no hunks that can be parsed
+        # (e.g., for binary files):
+        self.old_filename = None
+        self.new_filename = None
+
         if i >= len(lines):
             return
 
@@ -1053,71 +2037,1144 @@ class FileDiff:
                     sys.stderr.write('%s\n' % (e,))
 
 
+def parse_file_diff(file_lines):
+    """Return the FileDiff for file_lines, or None if it can't be parsed.
+
+    Parsing errors are reported to stderr."""
+
+    if stats is not None:
+        start = time.perf_counter()
+
+    try:
+        file_diff = FileDiff(file_lines)
+    except ParsingError as e:
+        sys.stderr.write('%s\n' % (e,))
+        file_diff = None
+
+    if stats is not None:
+        stats.add_time('parse', start)
+    return file_diff
+
+
 def iter_file_diffs(lines):
-    i = 0
+    """Iterate over the FileDiffs in a diff.
 
-    while i < len(lines):
-        assert lines[i].startswith('diff ')
-        start = i
-        i += 1
-        while i < len(lines) and not lines[i].startswith('diff '):
-            i += 1
-        end = i
+    lines can be any iterable over the lines of the diff. Only the
+    lines for one file are held in memory at a time.
+
+    """
+
+    file_lines = None
+
+    for line in lines:
+        if line.startswith('diff '):
+            if file_lines is not None:
+                file_diff = parse_file_diff(file_lines)
+                if file_diff is not None:
+                    yield file_diff
+            file_lines = [line]
+        else:
+            assert file_lines is not None
+            file_lines.append(line)
+
+    if file_lines is not None:
+        file_diff = parse_file_diff(file_lines)
+        if file_diff is not None:
+            yield file_diff
+
+
+def iter_file_hunks(lines):
+    """Iterate over (file_diff, hunk) for all of the hunks in a diff.
+
+    lines can be any iterable over the lines of the diff. This gives
+    the same hunks as `iter_file_diffs()`, but only the lines for one
+    hunk are held in memory at a time. Each file_diff is a FileDiff
+    that is parsed from the file's header only, so its `hunks` list
+    is empty.
+
+    """
 
+    file_diff = None
+
+    # The header lines of the current file, or None if its header has
+    # already been parsed:
+    header_lines = None
+
+    # The lines of the current hunk, or None if there is none:
+    hunk_lines = None
+
+    def parse_header():
         try:
-            yield FileDiff(lines[start:end])
+            return FileDiff(header_lines)
         except ParsingError as e:
             sys.stderr.write('%s\n' % (e,))
+            return None
+
+    def parse_hunk():
+        if file_diff is None or file_diff.old_filename is None:
+            return None
+        if stats is not None:
+            start = time.perf_counter()
+        try:
+            hunk = Hunk(
+                file_diff.old_filename, file_diff.new_filename, hunk_lines,
+                )
+        except ParsingError as e:
+            sys.stderr.write('%s\n' % (e,))
+            hunk = None
+        if stats is not None:
+            stats.add_time('parse', start)
+        return hunk
+
+    for line in lines:
+        if line.startswith('diff '):
+            if header_lines is not None:
+                parse_header()
+            elif hunk_lines is not None:
+                hunk = parse_hunk()
+                if hunk is not None:
+                    yield (file_diff, hunk)
+            file_diff = None
+            header_lines = [line]
+            hunk_lines = None
+        elif line.startswith('@@ ') and header_lines is not None:
+            file_diff = parse_header()
+            header_lines = None
+            hunk_lines = [line]
+        elif line.startswith('@@ ') and hunk_lines is not None:
+            hunk = parse_hunk()
+            if hunk is not None:
+                yield (file_diff, hunk)
+            hunk_lines = [line]
+        elif header_lines is not None:
+            header_lines.append(line)
+        else:
+            assert hunk_lines is not None
+            hunk_lines.append(line)
+
+    if header_lines is not None:
+        parse_header()
+    elif hunk_lines is not None:
+        hunk = parse_hunk()
+        if hunk is not None:
+            yield (file_diff, hunk)
+
+
+class DiffCache:
+    """A persistent cache of compressed `git diff` output.
+
+    Each entry is stored zlib-compressed in its own file under
+    `path`, named after the SHA-1 of its key (using a two-character
+    fan-out directory, like git's loose objects). The modification
+    time of an entry's file records when it was last used; when the
+    total size of the entries exceeds `limit`, the least-recently-used
+    entries are removed. Entries are written atomically, so several
+    processes can share one cache.
+
+    """
+
+    # The number of bytes of an entry to decompress at a time:
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, path, limit):
+        self.path = path
+        self.limit = limit
+
+        # The total size of the entries, or None if it hasn't been
+        # determined yet:
+        self.size = None
+
+    @staticmethod
+    def get_key(*words):
+        return hashlib.sha1('\0'.join(words).encode('utf-8')).hexdigest()
+
+    def _get_filename(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _iter_entries(self):
+        """Iterate over (filename, size, mtime) for the cache entries."""
+
+        try:
+            subdirs = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+
+        for subdir in subdirs:
+            subdir = os.path.join(self.path, subdir)
+            if not os.path.isdir(subdir):
+                continue
+            for entry in os.scandir(subdir):
+                if entry.name.startswith('tmp'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield (entry.path, st.st_size, st.st_mtime)
+
+    def __contains__(self, key):
+        return os.path.exists(self._get_filename(key))
+
+    def get(self, key):
+        """Return the (uncompressed) contents for key, or None."""
+
+        filename = self._get_filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            if stats is not None:
+                stats.count('disk cache misses')
+            return None
+
+        if stats is not None:
+            stats.count('disk cache hits')
+
+        try:
+            out = zlib.decompress(data)
+        except zlib.error:
+            sys.stderr.write('Ignoring corrupt diff cache entry %s\n' % (filename,))
+            return None
+
+        # Record the use for the sake of LRU eviction:
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+
+        return out
+
+    def get_chunks(self, key):
+        """Return an iterator over the (uncompressed) contents for key, or None.
+
+        The contents are decompressed incrementally, so they never
+        have to be held in memory all at once."""
+
+        filename = self._get_filename(key)
+        try:
+            f = open(filename, 'rb')
+        except FileNotFoundError:
+            if stats is not None:
+                stats.count('disk cache misses')
+            return None
+
+        if stats is not None:
+            stats.count('disk cache hits')
+
+        # Record the use for the sake of LRU eviction:
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+
+        return self._iter_decompressed(f, filename)
+
+    @staticmethod
+    def _iter_decompressed(f, filename):
+        with f:
+            decompressor = zlib.decompressobj()
+            try:
+                while True:
+                    data = f.read(DiffCache.CHUNK_SIZE)
+                    if not data:
+                        break
+                    yield decompressor.decompress(data)
+                yield decompressor.flush()
+            except zlib.error:
+                pass
+            else:
+                if decompressor.eof:
+                    return
+
+        # It is too late to fall back to computing the diff, so remove
+        # the entry and report the problem:
+        try:
+            os.unlink(filename)
+        except FileNotFoundError:
+            pass
+        raise ParsingError('corrupt diff cache entry %s removed' % (filename,))
+
+    def put(self, key, out):
+        """Store out (a bytes object) under key."""
+
+        for chunk in self.put_chunks(key, [out]):
+            pass
+
+    def put_chunks(self, key, chunks):
+        """Store the concatenation of chunks (bytes objects) under key.
+
+        Iterate over chunks, yielding each one after it has been
+        compressed and written. The entry is only added to the cache
+        if chunks is consumed completely without an error."""
+
+        filename = self._get_filename(key)
+        dirname = os.path.dirname(filename)
+        os.makedirs(dirname, exist_ok=True)
+        compressor = zlib.compressobj()
+        written = 0
+        (fd, tmpname) = tempfile.mkstemp(prefix='tmp', dir=dirname)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    data = compressor.compress(chunk)
+                    f.write(data)
+                    written += len(data)
+                    yield chunk
+                data = compressor.flush()
+                f.write(data)
+                written += len(data)
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+        if self.size is None:
+            self.size = sum(size for (_, size, _) in self._iter_entries())
+        else:
+            self.size += written
+
+        if self.size > self.limit:
+            self.evict()
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache is small enough.
+
+        Shrink the cache to 90% of its limit, so that eviction isn't
+        needed again right away."""
+
+        entries = sorted(self._iter_entries(), key=lambda entry: entry[2])
+        self.size = sum(size for (_, size, _) in entries)
+        target = self.limit * 9 // 10
+        for (filename, size, mtime) in entries:
+            if self.size <= target:
+                break
+            try:
+                os.unlink(filename)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+
+# A map {path : DiffCache} of the on-disk caches in use:
+diff_caches = {}
+
+
+def get_diff_cache(repo):
+    """Return the DiffCache for the corpus directory containing repo.
+
+    Return None if the on-disk cache is disabled."""
+
+    if not diff_cache_limit:
+        return None
+
+    path = os.path.join(os.path.dirname(os.path.normpath(repo)), 'diff-cache')
+    cache = diff_caches.get(path)
+    if cache is None:
+        cache = diff_caches[path] = DiffCache(path, diff_cache_limit)
+    return cache
+
+
+def read_git_config(repo, name, default, type=[]):
+    """Return the value of config setting name in repo, as seen by `git`."""
+
+    p = subprocess.run(
+        git + ['-C', repo, 'config'] + type + ['--get', name],
+        stdout=subprocess.PIPE, universal_newlines=True,
+        )
+    if p.returncode == 0:
+        return p.stdout.strip()
+    else:
+        return default
+
+
+def read_git_config_bool(repo, name, default):
+    value = read_git_config(repo, name, None, type=['--bool'])
+    if value is None:
+        return default
+    else:
+        return value == 'true'
+
+
+class CatFile:
+    """A long-lived `git cat-file --batch` process for reading objects."""
+
+    def __init__(self, repo):
+        self.process = subprocess.Popen(
+            git + ['-C', repo, 'cat-file', '--batch'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            )
+
+    def read_objects(self, revspecs):
+        """Read the objects named by revspecs.
+
+        Return a list containing, for each revspec, a tuple (oid,
+        type, contents), or None if there is no such object."""
+
+        for revspec in revspecs:
+            if '\n' in revspec:
+                raise ParsingError('invalid object name %r' % (revspec,))
+            self.process.stdin.write(revspec.encode('utf-8') + b'\n')
+        self.process.stdin.flush()
+
+        ret = []
+        for revspec in revspecs:
+            header = self.process.stdout.readline()
+            if not header:
+                raise RuntimeError('git cat-file exited unexpectedly')
+            words = header.split()
+            if len(words) != 3:
+                # "<revspec> missing" or "<revspec> ambiguous":
+                ret.append(None)
+                continue
+            (oid, type, size) = words
+            contents = self.process.stdout.read(int(size))
+            self.process.stdout.read(1)
+            ret.append((oid.decode('ascii'), type.decode('ascii'), contents))
+
+        return ret
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class CatFilePool:
+    """A pool of up to `size` CatFile processes for one repository.
+
+    Processes are started as they are needed and are reused. The pool
+    can be used from multiple threads."""
+
+    def __init__(self, repo, size):
+        self.repo = repo
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.workers = []
+
+        # Is the indent heuristic enabled for diffs in this repo?
+        self.indent_heuristic = read_git_config_bool(
+            repo, 'diff.indentHeuristic', True,
+            )
+
+        # Can the diffs be computed in-process? That is only possible
+        # for the Myers algorithm:
+        self.myers = read_git_config(repo, 'diff.algorithm', 'myers') in (
+            'myers', 'default',
+            )
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if len(self.workers) < self.size:
+                worker = CatFile(self.repo)
+                self.workers.append(worker)
+                return worker
+
+        return self.idle.get()
+
+    def read_objects(self, revspecs):
+        """Read objects using one of the pool's processes.
+
+        See `CatFile.read_objects()`."""
+
+        worker = self._acquire()
+        try:
+            ret = worker.read_objects(revspecs)
+        except BaseException:
+            # The process's output might not be in sync anymore, so
+            # don't reuse it:
+            with self.lock:
+                self.workers.remove(worker)
+            worker.process.kill()
+            worker.close()
+            raise
+        self.idle.put(worker)
+        return ret
+
+    def close(self):
+        """Shut down the pool's processes."""
+
+        with self.lock:
+            workers = self.workers
+            self.workers = []
+        for worker in workers:
+            worker.close()
+
+
+# A map {repo : CatFilePool} of the pools in use:
+cat_file_pools = {}
+
+
+def get_cat_file_pool(repo):
+    """Return the CatFilePool for repo, or None if pools are disabled."""
+
+    if not cat_file_pool_size:
+        return None
+
+    pool = cat_file_pools.get(repo)
+    if pool is None:
+        pool = cat_file_pools[repo] = CatFilePool(repo, cat_file_pool_size)
+    return pool
+
+
+@atexit.register
+def close_cat_file_pools():
+    while cat_file_pools:
+        (repo, pool) = cat_file_pools.popitem()
+        pool.close()
+
+
+def read_blobs(repo, old, new):
+    """Read the blobs old and new for diffing them in-process.
+
+    Return (pool, (old_oid, old_contents), (new_oid, new_contents)),
+    or None if the diff cannot be computed in-process (for example,
+    because old or new is not a blob)."""
+
+    pool = get_cat_file_pool(repo)
+    if pool is None or not pool.myers:
+        return None
+
+    if stats is not None:
+        start = time.perf_counter()
+    objects = pool.read_objects([old, new])
+    if stats is not None:
+        stats.add_time('read blobs', start)
+    if None in objects or any(type != 'blob' for (oid, type, contents) in objects):
+        return None
+
+    ((old_oid, _, old_contents), (new_oid, _, new_contents)) = objects
+    return (pool, (old_oid, old_contents), (new_oid, new_contents))
+
+
+def get_tree_entry_mode(tree, name):
+    """Return the mode of the entry called name in a tree.
+
+    tree is the contents of a tree object, as bytes. Return the mode
+    as a string like '100644', or None if there is no such entry."""
+
+    name = name.encode('utf-8')
+    i = 0
+    while i < len(tree):
+        j = tree.index(b'\0', i)
+        (mode, entry_name) = tree[i:j].split(b' ', 1)
+        if entry_name == name:
+            return mode.decode('ascii')
+        # Skip over the NUL and the binary object name:
+        i = j + 21
+    return None
+
+
+def read_blob_mode(pool, revspec):
+    """Return the mode of the blob named by revspec (`<rev>:<path>`).
+
+    The mode is read from the tree containing the blob. Return None
+    if it cannot be determined."""
+
+    (rev, path) = revspec.split(':', 1)
+    (dirname, basename) = os.path.split(path)
+    objects = pool.read_objects(['%s:%s' % (rev, dirname)])
+    if objects[0] is None or objects[0][1] != 'tree':
+        return None
+    return get_tree_entry_mode(objects[0][2], basename)
+
+
+def compute_blob_diff(repo, old, new):
+    """Compute the diff between the blobs old and new in-process.
+
+    The output is meant to be identical to that of `git diff -U20`,
+    except that the index line shows full object names. (That is why
+    it is not stored in the on-disk diff cache, which holds the output
+    of git.) Return the output as bytes, or None if it cannot be
+    computed in-process (for example, because old or new is not a
+    blob)."""
+
+    blobs = read_blobs(repo, old, new)
+    if blobs is None:
+        return None
+
+    (pool, (old_oid, old_contents), (new_oid, new_contents)) = blobs
+    if old_oid == new_oid:
+        return b''
+
+    # Like git, show the mode in the index line only if it is the
+    # same on both sides; we leave it to git to describe a change of
+    # mode:
+    if stats is not None:
+        start = time.perf_counter()
+    mode = read_blob_mode(pool, old)
+    new_mode = read_blob_mode(pool, new)
+    if stats is not None:
+        stats.add_time('read blobs', start)
+    if mode is None or new_mode != mode:
+        return None
+
+    old_filename = old.split(':', 1)[1]
+    new_filename = new.split(':', 1)[1]
+    out = [
+        'diff --git a/%s b/%s\n' % (old_filename, new_filename),
+        'index %s..%s %s\n' % (old_oid, new_oid, mode),
+        ]
+
+    if stats is not None:
+        start = time.perf_counter()
+    hunks = myers.diff_blobs(
+        old_contents, new_contents,
+        context=20, indent_heuristic=pool.indent_heuristic,
+        )
+    if stats is not None:
+        stats.add_time('in-process diff', start)
+    if hunks is None:
+        out.append(
+            'Binary files a/%s and b/%s differ\n' % (old_filename, new_filename)
+            )
+    else:
+        out.append('--- a/%s\n' % (old_filename,))
+        out.append('+++ b/%s\n' % (new_filename,))
+
+    out = ''.join(out).encode('utf-8')
+    if hunks is not None:
+        out += hunks
+    return out
+
+
+def get_header_values(s, e):
+    """Return (line, len) as they would be read from a hunk header.
+
+    [s, e) is the zero-based range of lines covered by the hunk."""
+
+    if e == s:
+        return (s, 0)
+    elif e == s + 1:
+        return (s + 1, None)
+    else:
+        return (s + 1, e - s)
+
+
+def compute_blob_hunks(repo, old, new):
+    """Compute the Hunks of the diff between the blobs old and new in-process.
+
+    The Hunks are built directly from the output of the diff engine,
+    without formatting the diff as text and parsing it again, but
+    they are the same as those that would be parsed from the output
+    of `compute_blob_diff()`. Return a list of Hunks, or None if the
+    diff cannot be computed this way."""
+
+    blobs = read_blobs(repo, old, new)
+    if blobs is None:
+        return None
+
+    (pool, (old_oid, old_contents), (new_oid, new_contents)) = blobs
+    if old_oid == new_oid:
+        return []
+
+    old_filename = old.split(':', 1)[1]
+    new_filename = new.split(':', 1)[1]
+    if (
+            shlex.quote(old_filename) != old_filename
+            or shlex.quote(new_filename) != new_filename
+            ):
+        # Leave it to `FileDiff` to report the problem:
+        return None
+
+    if stats is not None:
+        start = time.perf_counter()
+    hunk_records = myers.diff_blobs_to_hunks(
+        old_contents, new_contents,
+        context=20, indent_heuristic=pool.indent_heuristic,
+        )
+    if stats is not None:
+        stats.add_time('in-process diff', start)
+    if hunk_records is None:
+        # Binary files have no hunks:
+        return []
+
+    if stats is not None:
+        start = time.perf_counter()
+
+    hunks = []
+    for (s1, e1, s2, e2, prefixes, records) in hunk_records:
+        data = b''.join(records)
+        if data.count(b'\n') == len(records):
+            # Every record ends with a newline:
+            lines = data.decode('utf-8', errors='replace').split('\n')
+            del lines[-1]
+            difflines = list(map(DiffLine, prefixes.decode('ascii'), lines))
+        else:
+            difflines = []
+            for (i, rec) in enumerate(records):
+                line = rec.decode('utf-8', errors='replace')
+                prefix = chr(prefixes[i])
+                if line.endswith('\n'):
+                    difflines.append(DiffLine(prefix, line[:-1]))
+                else:
+                    difflines.append(DiffLine(prefix, line))
+                    difflines.append(DiffLine('\\', ' No newline at end of file'))
+
+        hunks.append(Hunk.from_difflines(
+            old_filename, new_filename,
+            *get_header_values(s1, e1), *get_header_values(s2, e2),
+            difflines,
+            ))
+
+    if stats is not None:
+        stats.add_time('parse', start)
+    return hunks
+
+
+# Revspecs that always refer to the same object (a full SHA-1,
+# possibly followed by ':<path>'); only diffs between such objects
+# can be cached:
+IMMUTABLE_REVSPEC_RE = re.compile(r'^[0-9a-f]{40}(\:.*)?$')
+
+SHA1_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
+class DiffTree:
+    """A long-lived `git diff-tree --stdin -p` process for one repository.
+
+    To diff two commits, `<new> <old>` is written to the process,
+    which then diffs <new> against <old> as if <old> were its parent.
+    That is followed by `END`, which is not an object name; diff-tree
+    echoes such lines verbatim, so it marks the end of the diff. The
+    options are chosen to give the same output as the `git diff`
+    command of `get_diff_command()`. diff-tree is plumbing, so it
+    ignores the diff settings in the config; they are read here and
+    passed explicitly instead.
+
+    """
+
+    END = b':end\n'
+
+    def __init__(self, repo):
+        self.cmd = git + [
+            '-C', repo, 'diff-tree', '--stdin', '-p', '-U20', '--always',
+            '--diff-algorithm=%s' % (
+                read_git_config(repo, 'diff.algorithm', 'myers'),
+                ),
+            ]
+
+        if read_git_config_bool(repo, 'diff.indentHeuristic', True):
+            self.cmd.append('--indent-heuristic')
+        else:
+            self.cmd.append('--no-indent-heuristic')
+
+        # `git diff` detects renames by default:
+        renames = read_git_config(repo, 'diff.renames', 'true').lower()
+        if renames in ('copies', 'copy'):
+            self.cmd.append('-C')
+        elif read_git_config_bool(repo, 'diff.renames', True):
+            self.cmd.append('-M')
+
+        self.process = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            )
+
+    def diff(self, old, new):
+        """Return the diff between the commits old and new, as bytes.
+
+        old and new must be full SHA-1s. Raise CalledProcessError if
+        the diff cannot be computed."""
+
+        assert SHA1_RE.match(old) and SHA1_RE.match(new)
+
+        if stats is not None:
+            start = time.perf_counter()
+
+        self.process.stdin.write(
+            new.encode('ascii') + b' ' + old.encode('ascii') + b'\n' + self.END
+            )
+        self.process.stdin.flush()
+
+        # With `--always`, the diff is preceded by a line containing
+        # <new>, even if it is empty:
+        header = self.process.stdout.readline()
+        out = []
+        if header != self.END:
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise RuntimeError('git diff-tree exited unexpectedly')
+                if line == self.END:
+                    break
+                out.append(line)
+
+        if stats is not None:
+            stats.add_time('git diff-tree', start)
+
+        if header != new.encode('ascii') + b'\n':
+            raise subprocess.CalledProcessError(128, self.cmd)
+
+        return b''.join(out)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+# A map {repo : DiffTree} of the diff-tree processes in use:
+diff_trees = {}
+
+
+def get_diff_tree(repo, old, new):
+    """Return a DiffTree for diffing old and new in repo, or None.
+
+    Return None if `use_diff_tree` is not set or if old and new are not
+    both full SHA-1s."""
+
+    if not use_diff_tree or not SHA1_RE.match(old) or not SHA1_RE.match(new):
+        return None
+
+    diff_tree = diff_trees.get(repo)
+    if diff_tree is None:
+        diff_tree = diff_trees[repo] = DiffTree(repo)
+    return diff_tree
+
+
+@atexit.register
+def close_diff_trees():
+    while diff_trees:
+        (repo, diff_tree) = diff_trees.popitem()
+        diff_tree.close()
+
+
+class MemoryCache:
+    """A least-recently-used cache with a budget in bytes.
+
+    The caller supplies the size of each value when adding it. The
+    most recently added value is always retained, even if it alone
+    exceeds the budget.
+
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        # An OrderedDict {key : (value, size)}, least recently used first:
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        try:
+            (value, size) = self.entries[key]
+        except KeyError:
+            if stats is not None:
+                stats.count('memory cache misses')
+            return None
+        if stats is not None:
+            stats.count('memory cache hits')
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, size):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self.entries[key] = (value, size)
+        self.size += size
+
+        while self.size > self.limit and len(self.entries) > 1:
+            (value, size) = self.entries.popitem(last=False)[1]
+            self.size -= size
+
 
+# A cache {key : lines} of recently-computed diffs, where key is
+# returned by `get_diff_memory_key()`. The Hunks of a diff are kept
+# under key + ('hunks',):
+diff_memory_cache = MemoryCache(diff_memory_limit)
+
+
+def get_diff_command(repo, old, new):
+    """Return the `git diff` command used to compute a diff."""
+
+    return git + ['-C', repo, 'diff', '-U20', old, new, '--']
+
+
+def get_diff_memory_key(repo, old, new):
+    """Return the key of the diff between old and new in memory.
+
+    Like the key of the on-disk diff cache, it includes the whole
+    `git diff` command, so changing `git` doesn't return diffs that
+    were computed with other options."""
+
+    return tuple(get_diff_command(repo, old, new))
+
+
+def get_diff_cache_key(repo, old, new):
+    """Return (cache, key) for storing the diff between old and new.
+
+    Return (None, None) if the diff shouldn't be cached on disk,
+    because the cache is disabled or because old or new is not an
+    immutable revspec."""
+
+    cache = get_diff_cache(repo)
+    if (
+            cache is None
+            or not IMMUTABLE_REVSPEC_RE.match(old)
+            or not IMMUTABLE_REVSPEC_RE.match(new)
+            ):
+        return (None, None)
+
+    key = DiffCache.get_key(
+        os.path.basename(os.path.normpath(repo)),
+        *(git + ['diff', '-U20', old, new, '--'])
+        )
+    return (cache, key)
 
-last_diff_args = None
-last_diff = None
 
 def compute_diff(repo, old, new):
     """Compute a git diff between old and new in the specified repo.
 
-    Set some options to try to get consistent output.
+    Set some options to try to get consistent output. Recently-used
+    diffs are kept in memory (see `diff_memory_limit`). If old and
+    new are given as full SHA-1s, the diff is also looked up in (and
+    added to) the on-disk diff cache. Diffs between two blobs
+    (`<rev>:<path>`) are computed in-process if possible (see
+    `compute_blob_diff()`), and diffs between two commits are
+    computed by a `DiffTree` if `use_diff_tree` is set.
 
     """
 
-    global last_diff_args, last_diff
+    memory_key = get_diff_memory_key(repo, old, new)
+    lines = diff_memory_cache.get(memory_key)
+    if lines is not None:
+        return lines
+
+    def run_diff():
+        out = None
+        diff_tree = get_diff_tree(repo, old, new)
+        if diff_tree is not None:
+            out = diff_tree.diff(old, new)
+        if out is None:
+            if stats is not None:
+                start = time.perf_counter()
+            out = subprocess.check_output(get_diff_command(repo, old, new))
+            if stats is not None:
+                stats.add_time('git diff', start)
+        return out
+
+    (cache, key) = get_diff_cache_key(repo, old, new)
+    out = None
+    if cache is not None:
+        out = cache.get(key)
+    if out is None and ':' in old and ':' in new:
+        # This is not exactly the output of git (see
+        # `compute_blob_diff()`), so don't store it under the key of
+        # the git command:
+        out = compute_blob_diff(repo, old, new)
+    if out is None:
+        out = run_diff()
+        if cache is not None:
+            cache.put(key, out)
+
+    if stats is not None:
+        start = time.perf_counter()
+    lines = out.decode('utf-8', errors='replace').split('\n')[:-1]
+    if stats is not None:
+        stats.add_time('decode', start)
+    diff_memory_cache.limit = diff_memory_limit
+    diff_memory_cache.put(
+        memory_key, lines,
+        sys.getsizeof(lines) + sum(map(sys.getsizeof, lines)),
+        )
+    return lines
+
+
+def iter_command_output(cmd, chunk_size=64 * 1024, stage='subprocess'):
+    """Run cmd, iterating over its output in chunks of bytes.
+
+    Raise CalledProcessError at the end if cmd fails. The time spent
+    waiting for the output is charged to stage (see `Stats`)."""
+
+    if stats is not None:
+        start = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(chunk_size)
+            if stats is not None:
+                stats.add_time(stage, start, calls=0 if data else 1)
+            if not data:
+                break
+            yield data
+            if stats is not None:
+                start = time.perf_counter()
+    finally:
+        process.stdout.close()
+        retcode = process.wait()
+
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, cmd)
+
+
+def iter_lines(chunks):
+    """Split chunks of UTF-8 output into lines, without their newlines.
+
+    Undecodable bytes are replaced, as in `compute_diff()`. Like
+    there, any text following the last newline is discarded."""
+
+    pending = []
+    for chunk in chunks:
+        if b'\n' not in chunk:
+            pending.append(chunk)
+            continue
+
+        if stats is not None:
+            start = time.perf_counter()
+        pending.append(chunk)
+        lines = b''.join(pending).split(b'\n')
+        pending = [lines.pop()]
+        lines = [line.decode('utf-8', errors='replace') for line in lines]
+        if stats is not None:
+            stats.add_time('decode', start)
+        yield from lines
+
+
+def iter_diff(repo, old, new):
+    """Iterate over the lines of the git diff between old and new.
+
+    The lines are the same as those returned by `compute_diff()`, but
+    the output of `git diff` (or of the on-disk diff cache) is read
+    incrementally, so a big diff never has to be held in memory all
+    at once. Diffs that are already in memory and diffs between blobs
+    are taken from `compute_diff()`. Diffs computed by a `DiffTree`
+    are read in one piece.
+
+    """
+
+    lines = diff_memory_cache.get(get_diff_memory_key(repo, old, new))
+    if lines is None and ':' in old and ':' in new:
+        lines = compute_diff(repo, old, new)
+    if lines is not None:
+        yield from lines
+        return
+
+    (cache, key) = get_diff_cache_key(repo, old, new)
+    chunks = None
+    if cache is not None:
+        chunks = cache.get_chunks(key)
+    if chunks is None:
+        diff_tree = get_diff_tree(repo, old, new)
+        if diff_tree is not None:
+            chunks = [diff_tree.diff(old, new)]
+        else:
+            chunks = iter_command_output(
+                get_diff_command(repo, old, new), stage='git diff',
+                )
+        if cache is not None:
+            chunks = cache.put_chunks(key, chunks)
+
+    yield from iter_lines(chunks)
 
-    args = (repo, old, new)
-    if last_diff_args == args:
-        return last_diff
 
-    cmd = git + [
-        '-C', repo,
-        'diff', '-U20',
-        old, new,
-        '--',
+def compute_hunks(repo, old, new):
+    """Return a list of the Hunks in the diff between old and new.
+
+    Diffs between two blobs whose text is not already cached are
+    computed in-process if possible (see `compute_blob_hunks()`), and
+    the resulting Hunks are kept in memory along with recently-used
+    diffs. Otherwise, the Hunks are parsed from the output of
+    `compute_diff()`.
+
+    """
+
+    memory_key = get_diff_memory_key(repo, old, new)
+    key = memory_key + ('hunks',)
+    hunks = diff_memory_cache.get(key)
+    if hunks is not None:
+        return hunks
+
+    # If the text of the diff is already at hand, parsing it is cheaper
+    # than recomputing the diff:
+    (cache, cache_key) = get_diff_cache_key(repo, old, new)
+    if (
+            ':' in old and ':' in new
+            and diff_memory_cache.get(memory_key) is None
+            and (cache is None or cache_key not in cache)
+            ):
+        hunks = compute_blob_hunks(repo, old, new)
+        if hunks is not None:
+            diff_memory_cache.limit = diff_memory_limit
+            diff_memory_cache.put(
+                key, hunks,
+                sum(
+                    sys.getsizeof(diffline.line)
+                    for hunk in hunks
+                    for diffline in hunk.difflines
+                    ),
+                )
+            return hunks
+
+    return [
+        hunk
+        for file_diff in iter_file_diffs(compute_diff(repo, old, new))
+        for hunk in file_diff.hunks
         ]
-    out = subprocess.check_output(cmd)
-    last_diff_args = args
-    last_diff = out.decode('utf-8', errors='replace').split('\n')[:-1]
-    return last_diff
 
 
-def find_slider(lines, old_filename, new_filename, prefix, line_number):
-    """Find the specified slider in the lines provided.
+def find_slider_in_hunks(hunks, prefix, line_number):
+    """Find the specified slider in the hunks provided.
 
     The line number must be canonical, but the returned slider will
     not necessarily be shifted canonically.
 
     """
 
-    for file_diff in iter_file_diffs(lines):
-        for hunk in file_diff.hunks:
-            for slider in hunk.iter_sliders():
-                if (
-                        slider.prefix == prefix
-                        and slider.line_number + slider.shift_range[-1] == line_number
-                    ):
-                    return slider
+    for hunk in hunks:
+        for slider in hunk.iter_sliders():
+            if (
+                    slider.prefix == prefix
+                    and slider.line_number + slider.shift_range[-1] == line_number
+                ):
+                return slider
 
     raise ParsingError('requested Slider was not found')
 
 
+def iter_named_sliders(hunks):
+    """Iterate over (key, slider) for all of the sliders in hunks.
+
+    key is (old_filename, new_filename, prefix, line_number), where
+    line_number is the canonical line number of the slider, as in
+    `SliderName.get_key()`. The sliders are not necessarily shifted
+    canonically.
+
+    """
+
+    for hunk in hunks:
+        for slider in hunk.iter_sliders():
+            yield (
+                (
+                    hunk.old_filename, hunk.new_filename,
+                    slider.prefix, slider.line_number + slider.shift_range[-1],
+                    ),
+                slider,
+                )
+
+
+def find_slider(lines, old_filename, new_filename, prefix, line_number):
+    """Find the specified slider in the lines provided.
+
+    The line number must be canonical, but the returned slider will
+    not necessarily be shifted canonically.
+
+    """
+
+    return find_slider_in_hunks(
+        (
+            hunk
+            for file_diff in iter_file_diffs(lines)
+            for hunk in file_diff.hunks
+            ),
+        prefix, line_number,
+        )
+
+
 COMMENT_RE = re.compile(r'^\s*(\#.*)?$')
 
 
@@ -1175,19 +3232,25 @@ class SliderName:
 
         return s
 
+    def get_key(self):
+        """Return the key of this slider as used by `iter_named_sliders()`."""
+
+        return (
+            self.old.split(':', 1)[1], self.new.split(':', 1)[1],
+            self.prefix, self.line_number,
+            )
+
     def compute_slider(self, repo):
         (old_sha1, old_filename) = self.old.split(':', 1)
         (new_sha1, new_filename) = self.new.split(':', 1)
 
-        lines = compute_diff(
+        hunks = compute_hunks(
             repo,
             '%s:%s' % (old_sha1, old_filename),
             '%s:%s' % (new_sha1, new_filename),
             )
 
-        slider = find_slider(
-            lines, old_filename, new_filename, self.prefix, self.line_number,
-            )
+        slider = find_slider_in_hunks(hunks, self.prefix, self.line_number)
         slider.shift_canonically()
         return slider
 
@@ -1216,6 +3279,678 @@ class SliderName:
         for (old, new, prefix, line_number, shifts) in iter_shifts(lines):
             yield (SliderName(old, new, prefix, line_number), shifts,)
 
+    @staticmethod
+    def process_grouped(items, process, window=10000):
+        """Call process(slidername, shifts) for items, grouped by diff.
+
+        `items` is an iterable over (slidername, shifts), as returned
+        by `SliderName.read()`. Up to `window` items at a time are
+        read, then processed grouped by their (old, new) pairs (in
+        order of first appearance), so that sliders sharing a diff are
+        computed one after the other. Iterate over the return values
+        of process in the original order of `items`.
+
+        """
+
+        items = iter(items)
+        while True:
+            chunk = list(itertools.islice(items, window))
+            if not chunk:
+                break
+
+            groups = OrderedDict()
+            for (i, (slidername, shifts)) in enumerate(chunk):
+                groups.setdefault((slidername.old, slidername.new), []).append(i)
+
+            results = [None] * len(chunk)
+            for indexes in groups.values():
+                for i in indexes:
+                    results[i] = process(*chunk[i])
+
+            yield from results
+
+
+class SliderIndex:
+    """A binary, indexed companion of a *.sliders file.
+
+    The index for `FOO.sliders` is stored in `FOO.sliders.idx` (see
+    `index-sliders`). It holds the same sliders and shifts as the text
+    file, in a form that can be searched via mmap without being parsed:
+
+    * A header: MAGIC, the number of records, the number of shifts, the
+      number of paths, and the size of the path table.
+
+    * The records, sorted by key, each `RECORD_FORMAT`: the old and new
+      object names as 20 bytes each, the numbers of the old and new
+      paths in the path table, the prefix, the canonical line number,
+      and the position and number of its shifts in the shift table.
+      The first `KEY_SIZE` bytes of a record are its key; records with
+      equal keys are kept in the order that they appeared in the text.
+
+    * The order table: the number of each record, in the order that
+      they appeared in the text.
+
+    * The shift table: the shifts of all of the records.
+
+    * The path table: the sorted, distinct paths, each terminated by a
+      NUL byte.
+
+    All integers are big-endian, so keys can be compared as bytes.
+    Only sliders whose objects are named as `<sha1>:<path>` with a
+    full SHA-1 can be indexed.
+
+    """
+
+    SUFFIX = '.idx'
+
+    MAGIC = b'SLIDX001'
+    HEADER_FORMAT = '>8sIIII'
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    KEY_FORMAT = '>20s20sIIcI'
+    KEY_SIZE = struct.calcsize(KEY_FORMAT)
+    RECORD_FORMAT = KEY_FORMAT + 'II'
+    RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+    SPEC_RE = re.compile(r'^(?P<sha1>[0-9a-f]{40})\:(?P<path>.*)$', re.DOTALL)
+
+    @staticmethod
+    def _parse_spec(spec):
+        m = SliderIndex.SPEC_RE.match(spec)
+        if not m:
+            return (None, None)
+        return (bytes.fromhex(m.group('sha1')), m.group('path'))
+
+    @staticmethod
+    def write(filename, items):
+        """Write an index holding items to filename.
+
+        items is an iterable over (SliderName, shifts), as returned by
+        `SliderName.read()`. The file is replaced atomically."""
+
+        entries = []
+        paths = set()
+        for (seq, (slidername, shifts)) in enumerate(items):
+            (old_oid, old_path) = SliderIndex._parse_spec(slidername.old)
+            (new_oid, new_path) = SliderIndex._parse_spec(slidername.new)
+            if (
+                    old_oid is None or new_oid is None
+                    or slidername.prefix not in ('-', '+')
+                    or slidername.line_number < 0
+                    ):
+                raise ParsingError('cannot index slider %s' % (slidername,))
+            paths.add(old_path)
+            paths.add(new_path)
+            entries.append((
+                old_oid, new_oid, old_path, new_path,
+                slidername.prefix, slidername.line_number, seq, shifts,
+                ))
+
+        paths = sorted(paths)
+        path_ids = {path : i for (i, path) in enumerate(paths)}
+
+        def get_key(entry):
+            (old_oid, new_oid, old_path, new_path, prefix, line_number, seq, shifts) = entry
+            return (
+                old_oid, new_oid, path_ids[old_path], path_ids[new_path],
+                prefix, line_number, seq,
+                )
+
+        entries.sort(key=get_key)
+
+        records = []
+        order = [0] * len(entries)
+        all_shifts = []
+        for (i, entry) in enumerate(entries):
+            (old_oid, new_oid, old_path, new_path, prefix, line_number, seq, shifts) = entry
+            records.append(struct.pack(
+                SliderIndex.RECORD_FORMAT,
+                old_oid, new_oid, path_ids[old_path], path_ids[new_path],
+                prefix.encode('ascii'), line_number,
+                len(all_shifts), len(shifts),
+                ))
+            order[seq] = i
+            all_shifts.extend(shifts)
+
+        path_table = b''.join(path.encode('utf-8') + b'\0' for path in paths)
+
+        dirname = os.path.dirname(os.path.abspath(filename))
+        (fd, tmpname) = tempfile.mkstemp(prefix='tmp', dir=dirname)
+        try:
+            # mkstemp() creates the file readable only by its owner:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(fd, 0o666 & ~umask)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack(
+                    SliderIndex.HEADER_FORMAT, SliderIndex.MAGIC,
+                    len(records), len(all_shifts), len(paths), len(path_table),
+                    ))
+                f.write(b''.join(records))
+                f.write(struct.pack('>%dI' % (len(order),), *order))
+                f.write(struct.pack('>%di' % (len(all_shifts),), *all_shifts))
+                f.write(path_table)
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < self.HEADER_SIZE:
+                raise ParsingError('%s is not a slider index' % (filename,))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._read_header()
+        except BaseException:
+            self.map.close()
+            raise
+
+    def _read_header(self):
+        filename = self.filename
+        (magic, self.count, nshifts, npaths, paths_size) = struct.unpack_from(
+            self.HEADER_FORMAT, self.map, 0,
+            )
+        if magic != self.MAGIC:
+            if magic[:5] == self.MAGIC[:5]:
+                raise ParsingError(
+                    '%s was written by a different version of index-sliders; '
+                    'please regenerate it' % (filename,)
+                    )
+            raise ParsingError('%s is not a slider index' % (filename,))
+
+        size = (
+            self.HEADER_SIZE
+            + self.count * (self.RECORD_SIZE + 4)
+            + 4 * nshifts
+            + paths_size
+            )
+        if len(self.map) != size:
+            raise ParsingError(
+                '%s is truncated or corrupt (%d bytes instead of %d)'
+                % (filename, len(self.map), size,)
+                )
+
+        self.records_offset = self.HEADER_SIZE
+        self.order_offset = self.records_offset + self.count * self.RECORD_SIZE
+        self.shifts_offset = self.order_offset + 4 * self.count
+        paths_offset = self.shifts_offset + 4 * nshifts
+
+        paths = self.map[paths_offset:paths_offset + paths_size].split(b'\0')
+        if len(paths) != npaths + 1 or paths[-1]:
+            raise ParsingError('%s has a corrupt path table' % (filename,))
+        self.paths = [path.decode('utf-8') for path in paths[:-1]]
+        self.path_ids = {path : i for (i, path) in enumerate(self.paths)}
+
+    def close(self):
+        self.map.close()
+
+    def __len__(self):
+        return self.count
+
+    def _get_key(self, i):
+        offset = self.records_offset + i * self.RECORD_SIZE
+        return self.map[offset:offset + self.KEY_SIZE]
+
+    def _read_record(self, i):
+        """Return (SliderName, shifts) for record number i."""
+
+        (
+            old_oid, new_oid, old_path, new_path, prefix, line_number,
+            shifts_start, nshifts,
+            ) = struct.unpack_from(
+                self.RECORD_FORMAT, self.map, self.records_offset + i * self.RECORD_SIZE,
+                )
+        shifts = list(struct.unpack_from(
+            '>%di' % (nshifts,), self.map, self.shifts_offset + 4 * shifts_start,
+            ))
+        slidername = SliderName(
+            '%s:%s' % (old_oid.hex(), self.paths[old_path]),
+            '%s:%s' % (new_oid.hex(), self.paths[new_path]),
+            prefix.decode('ascii'), line_number,
+            )
+        return (slidername, shifts)
+
+    def __iter__(self):
+        """Iterate over (SliderName, shifts) in their original order."""
+
+        order = struct.unpack_from('>%dI' % (self.count,), self.map, self.order_offset)
+        for i in order:
+            yield self._read_record(i)
+
+    def lookup(self, slidername):
+        """Return a list of the shifts recorded for slidername.
+
+        Return one list of shifts for each time that slidername
+        appears, in their original order (usually there is at most
+        one)."""
+
+        (old_oid, old_path) = self._parse_spec(slidername.old)
+        (new_oid, new_path) = self._parse_spec(slidername.new)
+        if (
+                old_oid is None or new_oid is None
+                or old_path not in self.path_ids or new_path not in self.path_ids
+                or slidername.prefix not in ('-', '+')
+                ):
+            return []
+
+        key = struct.pack(
+            self.KEY_FORMAT,
+            old_oid, new_oid, self.path_ids[old_path], self.path_ids[new_path],
+            slidername.prefix.encode('ascii'), slidername.line_number,
+            )
+
+        # Binary search for the first record with this key:
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        found = []
+        while lo < self.count and self._get_key(lo) == key:
+            found.append(self._read_record(lo)[1])
+            lo += 1
+        return found
+
+    def __contains__(self, slidername):
+        return bool(self.lookup(slidername))
+
+    @staticmethod
+    def open_for(path):
+        """Return a SliderIndex for the *.sliders file at path, or None.
+
+        path may name the index itself. Otherwise, use the companion
+        index of path if it exists and is not older than path."""
+
+        if path.endswith(SliderIndex.SUFFIX):
+            return SliderIndex(path)
+
+        index_path = path + SliderIndex.SUFFIX
+        try:
+            index_mtime = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        try:
+            if os.stat(path).st_mtime_ns > index_mtime:
+                return None
+        except FileNotFoundError:
+            pass
+
+        return SliderIndex(index_path)
+
+
+def read_sliders(path):
+    """Iterate over (SliderName, shifts) in the *.sliders file at path.
+
+    If the file has an up-to-date index (see `SliderIndex.open_for()`),
+    read it instead of parsing the text."""
+
+    index = SliderIndex.open_for(path)
+    if index is not None:
+        try:
+            yield from index
+        finally:
+            index.close()
+    else:
+        with open(path) as f:
+            yield from SliderName.read(f)
+
+
+def read_shift_columns(columns, only=None):
+    """Read the shifts in some *.sliders files, for comparing them.
+
+    columns is a list of (column_name, path), where path names a
+    *.sliders file (which is read using its index if possible; see
+    `read_sliders()`), or is '-' to read the file from stdin. Files
+    that don't exist are skipped, with a warning. Return (column_names,
+    all_shifts), where all_shifts is an OrderedDict {SliderName :
+    {column_name : [shift,...]}} in the order that the sliders were
+    first read.
+
+    If only is set, it is the name of a column, and only the sliders
+    that appear in that column are returned, in the order that they
+    appear there. That column is read first. The other columns are
+    joined to it: if a file has an index, each slider is looked up
+    in the index (see `SliderIndex.lookup()`) rather than reading the
+    whole file.
+
+    """
+
+    column_names = [column_name for (column_name, path) in columns]
+
+    all_shifts = OrderedDict()
+
+    slider_intern = {}
+
+    if only is not None:
+        columns = sorted(columns, key=lambda column: column[0] != only)
+
+    for (column_name, path) in columns:
+        join = only is not None and column_name != only
+        if path == '-':
+            source = SliderName.read(sys.stdin)
+        elif not os.path.isfile(path):
+            sys.stderr.write('Skipping non-existing file %r\n' % (path,))
+            continue
+        else:
+            index = SliderIndex.open_for(path) if join else None
+            if index is not None:
+                try:
+                    for (slidername, values) in all_shifts.items():
+                        found = index.lookup(slidername)
+                        if found:
+                            # As when reading the file, the last
+                            # occurrence wins:
+                            values[column_name] = found[-1]
+                finally:
+                    index.close()
+                continue
+            source = read_sliders(path)
+
+        for (slidername, shifts) in source:
+            if join:
+                values = all_shifts.get(slidername)
+                if values is not None:
+                    values[column_name] = shifts
+            else:
+                slidername = slider_intern.setdefault(slidername, slidername)
+                all_shifts.setdefault(slidername, {})[column_name] = shifts
+
+    return (column_names, all_shifts)
+
+
+def select_sliders(
+        column_names, all_shifts, correct=None,
+        all=False, any_wrong=False, any_nonzero=False, controversial=False,
+        ):
+    """Select the sliders whose shifts meet some criteria.
+
+    column_names and all_shifts are as returned by
+    `read_shift_columns()`. correct, if set, is the name of the column
+    holding the correct shifts. Select the sliders that meet any of
+    the criteria that are turned on (see `compare-shifts`). Return a
+    list of (slidername, columns), where columns is a list of
+    (column_name, shift) for all of the slider's shifts.
+
+    Only the shifts are compared, so no diffs have to be computed.
+
+    """
+
+    selected = []
+
+    for (slidername, values) in all_shifts.items():
+        columns = []
+        shifts_seen = set()
+        correct_shifts = None
+        for column_name in column_names:
+            shifts = values.get(column_name, [])
+
+            if correct and column_name == correct:
+                correct_shifts = set(shifts)
+                for shift in shifts:
+                    columns.append((column_name, shift))
+            else:
+                for shift in shifts:
+                    columns.append((column_name, shift))
+                    shifts_seen.add(shift)
+
+        if (
+                all
+                or any_wrong and correct_shifts and shifts_seen - correct_shifts
+                or any_nonzero and list(shifts_seen) != [0]
+                or controversial and not correct_shifts and len(shifts_seen) != 1
+                ):
+            selected.append((slidername, columns))
+
+    return selected
+
+
+def iter_rated_sliders(repo):
+    """Iterate over the human-rated sliders for repo.
+
+    Iterate over (slider, shifts), where slider is the Slider, shifted
+    canonically, and shifts is the list of shifts that the humans found
+    acceptable. Sliders that cannot be computed are reported to
+    stderr and skipped."""
+
+    with open('corpus/%s-human.sliders' % (repo,)) as f:
+        for (slidername, shifts) in SliderName.read(f):
+            try:
+                slider = slidername.compute_slider('corpus/%s.git' % (repo,))
+            except ParsingError as e:
+                sys.stderr.write(
+                    'Error parsing slider %s: %s\n' % (slidername, e,)
+                    )
+            else:
+                slider.shift_canonically()
+                yield (slider, shifts)
+
+
+class FeatureStore:
+    """A file of the split measurements of human-rated sliders.
+
+    This holds everything that is needed to evaluate scorers against
+    the rated sliders of some repositories, so that it can be done
+    without computing any diffs (see `extract-features`). The file,
+    which is read via mmap, consists of:
+
+    * A header: MAGIC, `SplitMeasurements.VERSION`, the number of
+      sliders, the number of measurements, the number of correct
+      shifts, the size of the field table, and the size of the
+      repository table.
+
+    * The field table: the names of the fields of the measurements,
+      separated by commas.
+
+    * The repository table: the repository names, each terminated by
+      a NUL byte.
+
+    * The sliders, each `RECORD_FORMAT`: the number of its repository,
+      its first shift and number of shifts (its shifts are
+      consecutive), the position of its measurements, and the
+      position and number of its correct shifts. A slider with N
+      shifts has 2*N measurements: those of the splits before the
+      change for each shift, followed by those of the splits after
+      the change.
+
+    * The measurements, as encoded by `SplitMeasurements.encode()`.
+
+    * The correct shifts.
+
+    All integers are big-endian. A file written by a different version
+    of the measurement code is rejected.
+
+    """
+
+    MAGIC = b'SLFEAT01'
+    HEADER_FORMAT = '>8sIIIIII'
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    RECORD_FORMAT = '>IiIIII'
+    RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+    MEASUREMENT_FORMAT = '>%di' % (len(SplitMeasurements.__slots__),)
+    MEASUREMENT_SIZE = struct.calcsize(MEASUREMENT_FORMAT)
+    FIELDS = ','.join(SplitMeasurements.__slots__).encode('ascii')
+
+    @staticmethod
+    def write(filename, entries):
+        """Write entries to a feature file.
+
+        entries is an iterable over (repo, slider, correct), where
+        slider is a Slider and correct is a list of the correct
+        shifts. The file is replaced atomically."""
+
+        repos = []
+        repo_ids = {}
+        records = []
+        measurements = []
+        all_correct = []
+        for (repo, slider, correct) in entries:
+            repo_id = repo_ids.get(repo)
+            if repo_id is None:
+                repo_id = repo_ids[repo] = len(repos)
+                repos.append(repo)
+
+            (shifts, pre_measurements, post_measurements) = slider.get_split_measurements()
+            records.append(struct.pack(
+                FeatureStore.RECORD_FORMAT,
+                repo_id, shifts[0], len(shifts),
+                len(measurements), len(all_correct), len(correct),
+                ))
+            for m in itertools.chain(pre_measurements, post_measurements):
+                measurements.append(
+                    struct.pack(FeatureStore.MEASUREMENT_FORMAT, *m.encode())
+                    )
+            all_correct.extend(correct)
+
+        repo_table = b''.join(repo.encode('utf-8') + b'\0' for repo in repos)
+
+        dirname = os.path.dirname(os.path.abspath(filename))
+        (fd, tmpname) = tempfile.mkstemp(prefix='tmp', dir=dirname)
+        try:
+            # mkstemp() creates the file readable only by its owner:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(fd, 0o666 & ~umask)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(struct.pack(
+                    FeatureStore.HEADER_FORMAT, FeatureStore.MAGIC,
+                    SplitMeasurements.VERSION,
+                    len(records), len(measurements), len(all_correct),
+                    len(FeatureStore.FIELDS), len(repo_table),
+                    ))
+                f.write(FeatureStore.FIELDS)
+                f.write(repo_table)
+                f.write(b''.join(records))
+                f.write(b''.join(measurements))
+                f.write(struct.pack('>%di' % (len(all_correct),), *all_correct))
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < self.HEADER_SIZE:
+                raise ParsingError('%s is not a feature file' % (filename,))
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._read_header()
+        except BaseException:
+            self.map.close()
+            raise
+
+    def _read_header(self):
+        filename = self.filename
+        (
+            magic, version, self.count, nmeasurements, ncorrect,
+            fields_size, repos_size,
+            ) = struct.unpack_from(self.HEADER_FORMAT, self.map, 0)
+        if magic != self.MAGIC:
+            raise ParsingError('%s is not a feature file' % (filename,))
+
+        offset = self.HEADER_SIZE
+        fields = self.map[offset:offset + fields_size]
+        offset += fields_size
+        if version != SplitMeasurements.VERSION or fields != self.FIELDS:
+            raise ParsingError(
+                '%s was written by a different version of the measurement code; '
+                'please regenerate it' % (filename,)
+                )
+
+        size = (
+            self.HEADER_SIZE + fields_size + repos_size
+            + self.count * self.RECORD_SIZE
+            + nmeasurements * self.MEASUREMENT_SIZE
+            + 4 * ncorrect
+            )
+        if len(self.map) != size:
+            raise ParsingError(
+                '%s is truncated or corrupt (%d bytes instead of %d)'
+                % (filename, len(self.map), size,)
+                )
+
+        self.repos = [
+            repo.decode('utf-8')
+            for repo in self.map[offset:offset + repos_size].split(b'\0')[:-1]
+            ]
+        offset += repos_size
+
+        self.records_offset = offset
+        self.measurements_offset = self.records_offset + self.count * self.RECORD_SIZE
+        self.correct_offset = (
+            self.measurements_offset + nmeasurements * self.MEASUREMENT_SIZE
+            )
+
+    def close(self):
+        self.map.close()
+
+    def load(self, repos, scorer_class):
+        """Return a map {repo : rated sliders} for the specified repos.
+
+        The rated sliders of each repo are a list of (features,
+        correct) pairs, where features is the slider's SliderFeatures
+        for scorer_class and correct is the set of correct shifts, in
+        the order that they were written."""
+
+        repo_ids = {repo : i for (i, repo) in enumerate(self.repos)}
+        missing = [repo for repo in repos if repo not in repo_ids]
+        if missing:
+            raise ParsingError(
+                '%s contains no sliders for %s' % (self.filename, ', '.join(missing),)
+                )
+
+        wanted = {repo_ids[repo] : [] for repo in repos}
+
+        # Equal measurements share one instance:
+        instances = {}
+
+        def read_measurements(i, n):
+            measurements = []
+            for k in range(i, i + n):
+                values = struct.unpack_from(
+                    self.MEASUREMENT_FORMAT, self.map,
+                    self.measurements_offset + k * self.MEASUREMENT_SIZE,
+                    )
+                m = instances.get(values)
+                if m is None:
+                    m = instances[values] = SplitMeasurements.decode(values)
+                measurements.append(m)
+            return measurements
+
+        for i in range(self.count):
+            (
+                repo_id, first_shift, nshifts, measurements_start,
+                correct_start, ncorrect,
+                ) = struct.unpack_from(
+                    self.RECORD_FORMAT, self.map, self.records_offset + i * self.RECORD_SIZE,
+                    )
+            sliders = wanted.get(repo_id)
+            if sliders is None:
+                continue
+
+            features = SliderFeatures.from_measurements(
+                scorer_class,
+                list(range(first_shift, first_shift + nshifts)),
+                read_measurements(measurements_start, nshifts),
+                read_measurements(measurements_start + nshifts, nshifts),
+                )
+            correct = struct.unpack_from(
+                '>%di' % (ncorrect,), self.map, self.correct_offset + 4 * correct_start,
+                )
+            sliders.append((features, set(correct)))
+
+        return dict(
+            (repo, wanted[repo_ids[repo]]) for repo in repos
+            )
+
 
 def load_scores(filename):
     """Load previously-computed scores from a file.
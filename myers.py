@@ -0,0 +1,995 @@
+#! /usr/bin/env python3
+
+"""A pure-Python version of the Myers diff used by `git diff`.
+
+This module transliterates the parts of git's xdiff library
+(`xprepare.c`, `xdiffi.c`, and `xemit.c`) that are used by
+
+    git -c diff.algorithm=myers diff -U<context> <blob> <blob>
+
+including xdiff's preprocessing of the input, its heuristics for
+bounding the cost of the search, the way it slides groups of changes
+(optionally using the indent heuristic), and the way it forms hunks.
+The goal is to produce exactly the same output as git, so that diffs
+can be computed without spawning a git process.
+
+The input files are `bytes` objects; the output is also `bytes`.
+
+Typical diffs change a few lines of a long file. Only the work that
+depends on the changed part of the files is done in Python; the long
+identical beginnings and ends of the files are handled by operations
+on whole lists and `bytearray`s.
+
+"""
+
+import collections
+
+
+# Constants from xdiff:
+XDL_MAX_COST_MIN = 256
+XDL_HEUR_MIN_COST = 256
+XDL_LINE_MAX = (1 << 63) - 1
+XDL_SNAKE_CNT = 20
+XDL_K_HEUR = 4
+XDL_MAX_EQLIMIT = 1024
+XDL_SIMSCAN_WINDOW = 100
+XDL_KPDIS_RUN = 4
+
+# Constants of the indent heuristic:
+MAX_INDENT = 200
+MAX_BLANKS = 20
+START_OF_FILE_PENALTY = 1
+END_OF_FILE_PENALTY = 21
+TOTAL_BLANK_WEIGHT = -30
+POST_BLANK_WEIGHT = 6
+RELATIVE_INDENT_PENALTY = -4
+RELATIVE_INDENT_WITH_BLANK_PENALTY = 10
+RELATIVE_OUTDENT_PENALTY = 24
+RELATIVE_OUTDENT_WITH_BLANK_PENALTY = 17
+RELATIVE_DEDENT_PENALTY = 23
+RELATIVE_DEDENT_WITH_BLANK_PENALTY = 17
+INDENT_WEIGHT = 60
+INDENT_HEURISTIC_MAX_SLIDING = 100
+
+# The number of bytes that git examines when deciding whether a file
+# is binary:
+FIRST_FEW_BYTES = 8000
+
+# The maximum length of the function name shown in hunk headers:
+FUNC_LINE_MAX = 80
+
+SPACE_BYTES = frozenset(b' \t\n\v\f\r')
+
+
+def bogosqrt(n):
+    i = 1
+    while n > 0:
+        i <<= 1
+        n >>= 2
+    return i
+
+
+def is_binary(data):
+    return b'\0' in data[:FIRST_FEW_BYTES]
+
+
+def split_records(data):
+    """Split data into records, each including its trailing LF (if any)."""
+
+    recs = data.split(b'\n')
+    last = recs.pop()
+    recs = [rec + b'\n' for rec in recs]
+    if last:
+        recs.append(last)
+    return recs
+
+
+class DiffFile:
+    """The state of one side of a diff (an `xdfile_t` in xdiff)."""
+
+    def __init__(self, recs):
+        self.recs = recs
+        self.nrec = len(recs)
+
+        # The equivalence class of each record. This is only filled in
+        # for the records between dstart and dend, since the others
+        # are only ever compared for equality:
+        self.ha = [0] * self.nrec
+
+        # rchg[i] is 1 if record i is changed. There is an extra
+        # element at the end, which is always zero; it serves as the
+        # sentinel for both rchg[nrec] and rchg[-1]:
+        self.rchg = bytearray(self.nrec + 1)
+
+        # The range of records remaining after trimming common lines
+        # from the beginning and end of the files:
+        self.dstart = 0
+        self.dend = self.nrec - 1
+
+        # The indexes and classes of the records that take part in
+        # the Myers algorithm:
+        self.rindex = []
+        self.reff_ha = []
+
+        # A cache of get_indent() results:
+        self.indents = [None] * self.nrec
+
+    def get_indent(self, i):
+        """Return the indent of record i, or -1 if it is all whitespace."""
+
+        ret = self.indents[i]
+        if ret is None:
+            ret = self.indents[i] = self._compute_indent(self.recs[i])
+        return ret
+
+    @staticmethod
+    def _compute_indent(rec):
+        ret = 0
+        for c in rec:
+            if c not in SPACE_BYTES:
+                return ret
+            elif c == 0x20:
+                ret += 1
+            elif c == 0x09:
+                ret += 8 - ret % 8
+            # Other whitespace characters are ignored.
+
+            if ret >= MAX_INDENT:
+                return MAX_INDENT
+
+        # The line contains only whitespace:
+        return -1
+
+
+def classify(xdf1, xdf2):
+    """Fill in the equivalence classes of the untrimmed records."""
+
+    classes = {}
+    for xdf in (xdf1, xdf2):
+        xdf.ha[xdf.dstart:xdf.dend + 1] = [
+            classes.setdefault(rec, len(classes))
+            for rec in xdf.recs[xdf.dstart:xdf.dend + 1]
+            ]
+
+
+def count_common_prefix(recs1, recs2, lim):
+    """Return the number of leading records (at most lim) that are equal."""
+
+    # Binary search, so that the comparisons are done by the list
+    # comparison code, which is much faster than a loop in Python:
+    lo = 0
+    hi = lim
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if recs1[lo:mid] == recs2[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def count_common_suffix(recs1, recs2, lim):
+    """Return the number of trailing records (at most lim) that are equal."""
+
+    n1 = len(recs1)
+    n2 = len(recs2)
+    lo = 0
+    hi = lim
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if recs1[n1 - mid:n1 - lo] == recs2[n2 - mid:n2 - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def trim_ends(xdf1, xdf2):
+    lim = min(xdf1.nrec, xdf2.nrec)
+    i = count_common_prefix(xdf1.recs, xdf2.recs, lim)
+    xdf1.dstart = xdf2.dstart = i
+
+    i = count_common_suffix(xdf1.recs, xdf2.recs, lim - i)
+    xdf1.dend = xdf1.nrec - i - 1
+    xdf2.dend = xdf2.nrec - i - 1
+
+
+def clean_mmatch(dis, i, s, e):
+    """Should the multimatch record i be discarded?
+
+    Such records are discarded only if they are in the middle of a
+    run of records that have no matches at all."""
+
+    if i - s > XDL_SIMSCAN_WINDOW:
+        s = i - XDL_SIMSCAN_WINDOW
+    if e - i > XDL_SIMSCAN_WINDOW:
+        e = i + XDL_SIMSCAN_WINDOW
+
+    r = 1
+    rdis0 = 0
+    rpdis0 = 1
+    while i - r >= s:
+        d = dis[i - r]
+        if d == 0:
+            rdis0 += 1
+        elif d == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    if rdis0 == 0:
+        return False
+
+    r = 1
+    rdis1 = 0
+    rpdis1 = 1
+    while i + r <= e:
+        d = dis[i + r]
+        if d == 0:
+            rdis1 += 1
+        elif d == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * XDL_KPDIS_RUN < rpdis1 + rdis1
+
+
+def cleanup_records(xdf, other_counts):
+    """Choose the records of xdf that take part in the Myers algorithm.
+
+    Records that have no match in the other file (and multimatch
+    records surrounded by such records) are marked as changed right
+    away. other_counts maps each record to the number of times it
+    occurs in the other file."""
+
+    mlim = min(bogosqrt(xdf.nrec), XDL_MAX_EQLIMIT)
+
+    dis = bytearray(xdf.nrec + 1)
+    for i in range(xdf.dstart, xdf.dend + 1):
+        nm = other_counts[xdf.recs[i]]
+        dis[i] = 0 if nm == 0 else 2 if nm >= mlim else 1
+
+    for i in range(xdf.dstart, xdf.dend + 1):
+        if dis[i] == 1 or (
+                dis[i] == 2 and not clean_mmatch(dis, i, xdf.dstart, xdf.dend)
+                ):
+            xdf.rindex.append(i)
+            xdf.reff_ha.append(xdf.ha[i])
+        else:
+            xdf.rchg[i] = 1
+
+
+class Env:
+    """Per-diff settings for the Myers algorithm (`xdalgoenv_t`)."""
+
+    def __init__(self, ndiags):
+        self.mxcost = max(bogosqrt(ndiags), XDL_MAX_COST_MIN)
+        self.snake_cnt = XDL_SNAKE_CNT
+        self.heur_min = XDL_HEUR_MIN_COST
+
+
+def split(ha1, off1, lim1, ha2, off2, lim2, kvdf, kvdb, koff, need_min, env):
+    """Find a point to split the box (off1, lim1) x (off2, lim2).
+
+    Return (i1, i2, min_lo, min_hi). kvdf and kvdb are the forward and
+    backward furthest-reaching paths, indexed by diagonal + koff."""
+
+    dmin = off1 - lim2
+    dmax = lim1 - off2
+    fmid = off1 - off2
+    bmid = lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    snake_cnt = env.snake_cnt
+
+    kvdf[fmid + koff] = off1
+    kvdb[bmid + koff] = lim1
+
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+
+        if fmin > dmin:
+            fmin -= 1
+            kvdf[fmin - 1 + koff] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvdf[fmax + 1 + koff] = -1
+        else:
+            fmax -= 1
+
+        for d in range(fmax, fmin - 1, -2):
+            if kvdf[d - 1 + koff] >= kvdf[d + 1 + koff]:
+                i1 = kvdf[d - 1 + koff] + 1
+            else:
+                i1 = kvdf[d + 1 + koff]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and ha1[i1] == ha2[i2]:
+                i1 += 1
+                i2 += 1
+            if i1 - prev1 > snake_cnt:
+                got_snake = True
+            kvdf[d + koff] = i1
+            if odd and bmin <= d <= bmax and kvdb[d + koff] <= i1:
+                return (i1, i2, True, True)
+
+        if bmin > dmin:
+            bmin -= 1
+            kvdb[bmin - 1 + koff] = XDL_LINE_MAX
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvdb[bmax + 1 + koff] = XDL_LINE_MAX
+        else:
+            bmax -= 1
+
+        for d in range(bmax, bmin - 1, -2):
+            if kvdb[d - 1 + koff] < kvdb[d + 1 + koff]:
+                i1 = kvdb[d - 1 + koff]
+            else:
+                i1 = kvdb[d + 1 + koff] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and ha1[i1 - 1] == ha2[i2 - 1]:
+                i1 -= 1
+                i2 -= 1
+            if prev1 - i1 > snake_cnt:
+                got_snake = True
+            kvdb[d + koff] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvdf[d + koff]:
+                return (i1, i2, True, True)
+
+        if need_min:
+            continue
+
+        # If the edit cost is above the heuristic trigger and we got
+        # a good snake, look for a diagonal that has made
+        # "interesting" progress:
+        if got_snake and ec > env.heur_min:
+            best = 0
+            for d in range(fmax, fmin - 1, -2):
+                dd = d - fmid if d > fmid else fmid - d
+                i1 = kvdf[d + koff]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - dd
+
+                if (
+                        v > XDL_K_HEUR * ec and v > best
+                        and off1 + snake_cnt <= i1 < lim1
+                        and off2 + snake_cnt <= i2 < lim2
+                        ):
+                    k = 1
+                    while ha1[i1 - k] == ha2[i2 - k]:
+                        if k == snake_cnt:
+                            best = v
+                            spl = (i1, i2)
+                            break
+                        k += 1
+            if best > 0:
+                return (spl[0], spl[1], True, False)
+
+            best = 0
+            for d in range(bmax, bmin - 1, -2):
+                dd = d - bmid if d > bmid else bmid - d
+                i1 = kvdb[d + koff]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - dd
+
+                if (
+                        v > XDL_K_HEUR * ec and v > best
+                        and off1 < i1 <= lim1 - snake_cnt
+                        and off2 < i2 <= lim2 - snake_cnt
+                        ):
+                    k = 0
+                    while ha1[i1 + k] == ha2[i2 + k]:
+                        if k == snake_cnt - 1:
+                            best = v
+                            spl = (i1, i2)
+                            break
+                        k += 1
+            if best > 0:
+                return (spl[0], spl[1], False, True)
+
+        # Enough is enough. Take the furthest-reaching path found so
+        # far, measured by i1 + i2:
+        if ec >= env.mxcost:
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvdf[d + koff], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1 = lim2 + d
+                    i2 = lim2
+                if fbest < i1 + i2:
+                    fbest = i1 + i2
+                    fbest1 = i1
+
+            bbest = bbest1 = XDL_LINE_MAX
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvdb[d + koff])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1 = off2 + d
+                    i2 = off2
+                if i1 + i2 < bbest:
+                    bbest = i1 + i2
+                    bbest1 = i1
+
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return (fbest1, fbest - fbest1, True, False)
+            else:
+                return (bbest1, bbest - bbest1, False, True)
+
+
+def recs_cmp(xdf1, xdf2, need_min):
+    """Mark the changed records of xdf1 and xdf2 using Myers' algorithm."""
+
+    ha1 = xdf1.reff_ha
+    ha2 = xdf2.reff_ha
+    rchg1 = xdf1.rchg
+    rchg2 = xdf2.rchg
+    rindex1 = xdf1.rindex
+    rindex2 = xdf2.rindex
+
+    ndiags = len(ha1) + len(ha2) + 3
+    kvdf = [0] * ndiags
+    kvdb = [0] * ndiags
+    koff = len(ha2) + 1
+    env = Env(ndiags)
+
+    # xdiff does this recursively; we use an explicit stack instead.
+    # The order in which the sub-boxes are processed doesn't matter:
+    stack = [(0, len(ha1), 0, len(ha2), need_min)]
+    while stack:
+        (off1, lim1, off2, lim2, need_min) = stack.pop()
+
+        # Shrink the box by walking through each diagonal snake:
+        while off1 < lim1 and off2 < lim2 and ha1[off1] == ha2[off2]:
+            off1 += 1
+            off2 += 1
+        while off1 < lim1 and off2 < lim2 and ha1[lim1 - 1] == ha2[lim2 - 1]:
+            lim1 -= 1
+            lim2 -= 1
+
+        # If one dimension is empty, then all records on the other
+        # one must be changed:
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                rchg2[rindex2[i]] = 1
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                rchg1[rindex1[i]] = 1
+        else:
+            (i1, i2, min_lo, min_hi) = split(
+                ha1, off1, lim1, ha2, off2, lim2, kvdf, kvdb, koff, need_min, env,
+                )
+            stack.append((i1, lim1, i2, lim2, min_hi))
+            stack.append((off1, i1, off2, i2, min_lo))
+
+
+def find_unchanged(xdf, i, n):
+    """Return the nth index after i whose record is unchanged.
+
+    nrec counts as unchanged. Return -1 if there are fewer than n such
+    indexes."""
+
+    rchg = xdf.rchg
+    nrec = xdf.nrec
+    i += 1
+    while i <= nrec:
+        if rchg[i]:
+            # Skip the changed records; the sentinel stops the search:
+            i = rchg.find(0, i)
+        else:
+            end = rchg.find(1, i, nrec)
+            if end == -1:
+                end = nrec + 1
+            if n <= end - i:
+                return i + n - 1
+            n -= end - i
+            i = end
+
+    return -1
+
+
+class Group:
+    """A group of changed records, [start, end) (`struct xdlgroup`)."""
+
+    __slots__ = ['start', 'end']
+
+    def __init__(self, xdf):
+        self.start = self.end = 0
+        while xdf.rchg[self.end]:
+            self.end += 1
+
+    def next(self, xdf):
+        """Move to the next group. Return False if there is none."""
+
+        if self.end == xdf.nrec:
+            return False
+
+        self.start = self.end + 1
+        self.end = self.start
+        while xdf.rchg[self.end]:
+            self.end += 1
+
+        return True
+
+    def skip(self, xdf, n):
+        """Move forward n groups, like calling `next()` n times.
+
+        Return False if there are fewer than n groups left. This is
+        fast even if most of the groups are empty."""
+
+        if n == 0:
+            return True
+
+        # Each call to next() moves self.end to the next unchanged
+        # record (or to nrec) and self.start to just past the previous
+        # one:
+        if n == 1:
+            start = self.end + 1
+        else:
+            start = find_unchanged(xdf, self.end, n - 1)
+            if start == -1:
+                return False
+            start += 1
+        end = find_unchanged(xdf, self.end, n)
+        if end == -1:
+            return False
+
+        self.start = start
+        self.end = end
+        return True
+
+    def previous(self, xdf):
+        """Move to the previous group. Return False if there is none."""
+
+        if self.start == 0:
+            return False
+
+        self.end = self.start - 1
+        self.start = self.end
+        while xdf.rchg[self.start - 1]:
+            self.start -= 1
+
+        return True
+
+    def slide_down(self, xdf):
+        """Slide the group down one line if possible, merging groups."""
+
+        if self.end < xdf.nrec and xdf.recs[self.start] == xdf.recs[self.end]:
+            xdf.rchg[self.start] = 0
+            xdf.rchg[self.end] = 1
+            self.start += 1
+            self.end += 1
+            while xdf.rchg[self.end]:
+                self.end += 1
+            return True
+        else:
+            return False
+
+    def slide_up(self, xdf):
+        """Slide the group up one line if possible, merging groups."""
+
+        if self.start > 0 and xdf.recs[self.start - 1] == xdf.recs[self.end - 1]:
+            self.start -= 1
+            self.end -= 1
+            xdf.rchg[self.start] = 1
+            xdf.rchg[self.end] = 0
+            while xdf.rchg[self.start - 1]:
+                self.start -= 1
+            return True
+        else:
+            return False
+
+
+def measure_split(xdf, split):
+    """Return (end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent)."""
+
+    if split >= xdf.nrec:
+        end_of_file = True
+        indent = -1
+    else:
+        end_of_file = False
+        indent = xdf.get_indent(split)
+
+    pre_blank = 0
+    pre_indent = -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = xdf.get_indent(i)
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == MAX_BLANKS:
+            pre_indent = 0
+            break
+
+    post_blank = 0
+    post_indent = -1
+    for i in range(split + 1, xdf.nrec):
+        post_indent = xdf.get_indent(i)
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == MAX_BLANKS:
+            post_indent = 0
+            break
+
+    return (end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent)
+
+
+def score_split(m):
+    """Return (effective_indent, penalty) for a split_measurement m."""
+
+    (end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent) = m
+
+    penalty = 0
+
+    if pre_indent == -1 and pre_blank == 0:
+        penalty += START_OF_FILE_PENALTY
+
+    if end_of_file:
+        penalty += END_OF_FILE_PENALTY
+
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+
+    penalty += TOTAL_BLANK_WEIGHT * total_blank
+    penalty += POST_BLANK_WEIGHT * post_blank
+
+    if indent == -1:
+        indent = post_indent
+
+    any_blanks = (total_blank != 0)
+
+    if indent == -1:
+        pass
+    elif pre_indent == -1:
+        pass
+    elif indent > pre_indent:
+        if any_blanks:
+            penalty += RELATIVE_INDENT_WITH_BLANK_PENALTY
+        else:
+            penalty += RELATIVE_INDENT_PENALTY
+    elif indent == pre_indent:
+        pass
+    elif post_indent != -1 and post_indent > indent:
+        if any_blanks:
+            penalty += RELATIVE_OUTDENT_WITH_BLANK_PENALTY
+        else:
+            penalty += RELATIVE_OUTDENT_PENALTY
+    else:
+        if any_blanks:
+            penalty += RELATIVE_DEDENT_WITH_BLANK_PENALTY
+        else:
+            penalty += RELATIVE_DEDENT_PENALTY
+
+    return (indent, penalty)
+
+
+def score_cmp(s1, s2):
+    cmp_indents = (s1[0] > s2[0]) - (s1[0] < s2[0])
+    return INDENT_WEIGHT * cmp_indents + (s1[1] - s2[1])
+
+
+def change_compact(xdf, xdfo, indent_heuristic):
+    """Slide the groups of changes in xdf to their final positions.
+
+    Groups are merged where possible, aligned with groups of changes
+    in the other file xdfo if possible, and otherwise shifted as far
+    down as possible or positioned using the indent heuristic."""
+
+    g = Group(xdf)
+    go = Group(xdfo)
+
+    while True:
+        if g.end != g.start:
+            # Shift the change up and then down as far as possible,
+            # merging it with any other changes it bumps into:
+            while True:
+                groupsize = g.end - g.start
+
+                # The last "end" that lines up with a group of
+                # changes in the other file, or -1:
+                end_matching_other = -1
+
+                while g.slide_up(xdf):
+                    if not go.previous(xdfo):
+                        raise AssertionError('group sync broken sliding up')
+
+                earliest_end = g.end
+
+                if go.end > go.start:
+                    end_matching_other = g.end
+
+                while g.slide_down(xdf):
+                    if not go.next(xdfo):
+                        raise AssertionError('group sync broken sliding down')
+                    if go.end > go.start:
+                        end_matching_other = g.end
+
+                if groupsize == g.end - g.start:
+                    break
+
+            if g.end == earliest_end:
+                # No shifting was possible.
+                pass
+            elif end_matching_other != -1:
+                # Line the group up with the last group of changes
+                # from the other file that it can align with:
+                while go.end == go.start:
+                    if not g.slide_up(xdf):
+                        raise AssertionError('match disappeared')
+                    if not go.previous(xdfo):
+                        raise AssertionError('group sync broken sliding to match')
+            elif indent_heuristic:
+                best_shift = -1
+                best_score = None
+
+                shift = max(
+                    earliest_end,
+                    g.end - groupsize - 1,
+                    g.end - INDENT_HEURISTIC_MAX_SLIDING,
+                    )
+                while shift <= g.end:
+                    s1 = score_split(measure_split(xdf, shift))
+                    s2 = score_split(measure_split(xdf, shift - groupsize))
+                    score = (s1[0] + s2[0], s1[1] + s2[1])
+                    if best_shift == -1 or score_cmp(score, best_score) <= 0:
+                        best_score = score
+                        best_shift = shift
+                    shift += 1
+
+                while g.end > best_shift:
+                    if not g.slide_up(xdf):
+                        raise AssertionError('best shift unreached')
+                    if not go.previous(xdfo):
+                        raise AssertionError('group sync broken sliding to blank line')
+
+        # Move past the just-processed group and any empty groups
+        # following it, and keep go in sync:
+        i = xdf.rchg.find(1, g.end + 1, xdf.nrec)
+        if i == -1:
+            if not go.skip(xdfo, xdf.nrec - g.end):
+                raise AssertionError('group sync broken moving to next group')
+            break
+
+        if not go.skip(xdfo, i - g.end):
+            raise AssertionError('group sync broken moving to next group')
+        g.start = i
+        g.end = xdf.rchg.find(0, i)
+
+    if go.next(xdfo):
+        raise AssertionError('group sync broken at end of file')
+
+
+def build_script(xdf1, xdf2):
+    """Return a list [(i1, i2, chg1, chg2), ...] of the changes."""
+
+    rchg1 = xdf1.rchg
+    rchg2 = xdf2.rchg
+    nrec1 = xdf1.nrec
+    nrec2 = xdf2.nrec
+    script = []
+
+    i1 = i2 = 0
+    while True:
+        # Skip over unchanged records, which pair up one-to-one:
+        c1 = rchg1.find(1, i1, nrec1)
+        if c1 == -1:
+            c1 = nrec1
+        c2 = rchg2.find(1, i2, nrec2)
+        if c2 == -1:
+            c2 = nrec2
+        n = min(c1 - i1, c2 - i2)
+        i1 += n
+        i2 += n
+
+        if i1 == nrec1 and i2 == nrec2:
+            break
+
+        # The sentinels stop these searches:
+        l1 = rchg1.find(0, i1)
+        l2 = rchg2.find(0, i2)
+        script.append((i1, i2, l1 - i1, l2 - i2))
+        i1 = l1
+        i2 = l2
+
+    return script
+
+
+def diff_files(recs1, recs2, indent_heuristic=True, need_min=False):
+    """Diff two lists of records.
+
+    Return (xdf1, xdf2, script), where script is as returned by
+    `build_script()`."""
+
+    xdf1 = DiffFile(recs1)
+    xdf2 = DiffFile(recs2)
+
+    trim_ends(xdf1, xdf2)
+    classify(xdf1, xdf2)
+    cleanup_records(xdf1, collections.Counter(recs2))
+    cleanup_records(xdf2, collections.Counter(recs1))
+
+    recs_cmp(xdf1, xdf2, need_min)
+
+    change_compact(xdf1, xdf2, indent_heuristic)
+    change_compact(xdf2, xdf1, indent_heuristic)
+
+    return (xdf1, xdf2, build_script(xdf1, xdf2))
+
+
+def iter_hunks(script, nrec1, nrec2, context):
+    """Group the changes in script into hunks.
+
+    Iterate over (s1, e1, s2, e2, changes), where [s1, e1) and [s2,
+    e2) are the ranges of records covered by the hunk (including
+    context) and changes is the list of changes that it contains."""
+
+    max_common = 2 * context
+
+    i = 0
+    while i < len(script):
+        j = i + 1
+        while j < len(script):
+            (i1, i2, chg1, chg2) = script[j - 1]
+            if script[j][0] - (i1 + chg1) > max_common:
+                break
+            j += 1
+
+        first = script[i]
+        last = script[j - 1]
+        s1 = max(first[0] - context, 0)
+        s2 = max(first[1] - context, 0)
+        lctx = min(
+            context,
+            nrec1 - (last[0] + last[2]),
+            nrec2 - (last[1] + last[3]),
+            )
+        e1 = last[0] + last[2] + lctx
+        e2 = last[1] + last[3] + lctx
+
+        yield (s1, e1, s2, e2, script[i:j])
+        i = j
+
+
+def get_func_line(rec):
+    """Return the function name for rec as shown in hunk headers, or None."""
+
+    if rec and (rec[:1].isalpha() or rec[0] in b'_$'):
+        return rec[:FUNC_LINE_MAX].rstrip(bytes(SPACE_BYTES))
+    else:
+        return None
+
+
+def format_range(s, count):
+    if count == 1:
+        return b'%d' % (s,)
+    elif count == 0:
+        return b'%d,0' % (s - 1,)
+    else:
+        return b'%d,%d' % (s, count)
+
+
+def emit_record(out, prefix, rec):
+    out.append(prefix)
+    out.append(rec)
+    if not rec.endswith(b'\n'):
+        out.append(b'\n\\ No newline at end of file\n')
+
+
+def iter_hunk_records(xdf1, xdf2, script, context):
+    """Iterate over the hunks of the diff.
+
+    Iterate over (s1, e1, s2, e2, prefixes, records), where [s1, e1)
+    and [s2, e2) are the ranges of records covered by the hunk,
+    records is a list of the records shown in the hunk, and prefixes
+    is a bytes object holding the prefix (b' ', b'-', or b'+') of
+    each of them."""
+
+    recs1 = xdf1.recs
+    recs2 = xdf2.recs
+
+    for (s1, e1, s2, e2, changes) in iter_hunks(script, xdf1.nrec, xdf2.nrec, context):
+        prefixes = []
+        records = []
+
+        def add(prefix, recs):
+            prefixes.append(prefix * len(recs))
+            records.extend(recs)
+
+        (i1, i2, chg1, chg2) = changes[0]
+        add(b' ', recs2[s2:i2])
+
+        for (n, (i1, i2, chg1, chg2)) in enumerate(changes):
+            if n:
+                (p1, p2, pchg1, pchg2) = changes[n - 1]
+                add(b' ', recs2[p2 + pchg2:i2])
+            add(b'-', recs1[i1:i1 + chg1])
+            add(b'+', recs2[i2:i2 + chg2])
+
+        (i1, i2, chg1, chg2) = changes[-1]
+        add(b' ', recs2[i2 + chg2:e2])
+
+        yield (s1, e1, s2, e2, b''.join(prefixes), records)
+
+
+def emit_diff(xdf1, xdf2, script, context):
+    """Return the unified diff (without file headers) as bytes."""
+
+    out = []
+    recs1 = xdf1.recs
+
+    func_line = b''
+    func_line_prev = -1
+
+    for (s1, e1, s2, e2, prefixes, records) in iter_hunk_records(
+            xdf1, xdf2, script, context
+            ):
+        # Look backwards for a function name, but no further than
+        # where the previous search started. If none is found, the
+        # previous one is reused:
+        for l in range(s1 - 1, func_line_prev, -1):
+            line = get_func_line(recs1[l])
+            if line is not None:
+                func_line = line
+                break
+        func_line_prev = s1 - 1
+
+        out.append(b'@@ -%s +%s @@' % (
+            format_range(s1 + 1, e1 - s1), format_range(s2 + 1, e2 - s2),
+            ))
+        if func_line:
+            out.append(b' ' + func_line)
+        out.append(b'\n')
+
+        for (i, rec) in enumerate(records):
+            emit_record(out, prefixes[i:i + 1], rec)
+
+    return b''.join(out)
+
+
+def diff_blobs(old, new, context=3, indent_heuristic=True):
+    """Return the hunks of the unified diff between old and new as bytes.
+
+    old and new are the contents of the files. Return None if either
+    of the files looks binary."""
+
+    if is_binary(old) or is_binary(new):
+        return None
+
+    (xdf1, xdf2, script) = diff_files(
+        split_records(old), split_records(new), indent_heuristic=indent_heuristic,
+        )
+    return emit_diff(xdf1, xdf2, script, context)
+
+
+def diff_blobs_to_hunks(old, new, context=3, indent_heuristic=True):
+    """Return the hunks of the diff between old and new as data.
+
+    Return a list of (s1, e1, s2, e2, prefixes, records) tuples, as
+    generated by `iter_hunk_records()`, or None if either of the files
+    looks binary. This is faster than `diff_blobs()`, because it doesn't
+    have to search for function names for the hunk headers."""
+
+    if is_binary(old) or is_binary(new):
+        return None
+
+    (xdf1, xdf2, script) = diff_files(
+        split_records(old), split_records(new), indent_heuristic=indent_heuristic,
+        )
+    return list(iter_hunk_records(xdf1, xdf2, script, context))